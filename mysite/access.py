@@ -8,6 +8,10 @@ from datetime import datetime, timedelta
 import json
 import os
 import logging
+import tempfile
+import threading
+
+from locks import DatasetLocks
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -42,8 +46,7 @@ class User(UserMixin):
     @staticmethod
     def get(user_id):
         try:
-            users = load_access_users()
-            user_data = next((user for user in users if str(user.get('id')) == str(user_id)), None)
+            user_data = access_user_table()['by_id'].get(str(user_id))
             if user_data:
                 return User(
                     user_id=user_data['id'],
@@ -58,8 +61,7 @@ class User(UserMixin):
     @staticmethod
     def get_by_username(username):
         try:
-            users = load_access_users()
-            user_data = next((user for user in users if user['username'] == username), None)
+            user_data = access_user_table()['by_username'].get(username)
             if user_data:
                 return User(
                     user_id=user_data['id'],
@@ -92,17 +94,64 @@ def get_data_dir():
         # Fall back to current directory/data if all else fails
         return os.path.join(os.getcwd(), 'data')
 
+# Parsed access_users.json indexed by id and username, keyed by the file's
+# (mtime, size, inode) so writes from other workers are picked up
+_access_users_file = None
+_access_user_table = {'signature': None, 'users': [], 'by_id': {}, 'by_username': {}}
+_access_users_lock = threading.Lock()
+_access_users_locks = None
+
+def access_users_file():
+    """Path of access_users.json, resolved once per process"""
+    global _access_users_file
+    if _access_users_file is None:
+        _access_users_file = os.path.join(get_data_dir(), 'access_users.json')
+    return _access_users_file
+
+def access_users_lock():
+    """Writer lock of access_users.json, shared with the DataStore's dataset locks"""
+    global _access_users_locks
+    if _access_users_locks is None:
+        _access_users_locks = DatasetLocks(os.path.join(os.path.dirname(access_users_file()), 'changes'))
+    return _access_users_locks.lock('access_users')
+
+def access_user_table():
+    """Return the cached user table, re-reading the file only when it changed"""
+    global _access_user_table
+    user_file = access_users_file()
+    try:
+        st = os.stat(user_file)
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+    except FileNotFoundError:
+        signature = None
+
+    table = _access_user_table
+    if table['signature'] == signature:
+        return table
+
+    with _access_users_lock:
+        users = []
+        if signature is not None:
+            with open(user_file, 'r') as f:
+                users = json.load(f)
+        table = {
+            'signature': signature,
+            'users': users,
+            'by_id': {str(user.get('id')): user for user in reversed(users)},
+            'by_username': {user['username']: user for user in reversed(users)},
+        }
+        _access_user_table = table
+        return table
+
+def invalidate_access_users():
+    global _access_user_table
+    with _access_users_lock:
+        _access_user_table = {'signature': None, 'users': [], 'by_id': {}, 'by_username': {}}
+
 def load_access_users():
     """Load access users with proper error handling"""
     try:
-        data_dir = get_data_dir()
-        user_file = os.path.join(data_dir, 'access_users.json')
-
-        if not os.path.exists(user_file):
-            return []
-
-        with open(user_file, 'r') as f:
-            return json.load(f)
+        return [dict(user) for user in access_user_table()['users']]
     except Exception as e:
         logger.error(f"Error loading access users: {e}")
         return []
@@ -110,23 +159,34 @@ def load_access_users():
 def save_access_users(users):
     """Save access users with proper error handling"""
     try:
-        data_dir = get_data_dir()
-        user_file = os.path.join(data_dir, 'access_users.json')
+        user_file = access_users_file()
 
         # Create directory if it doesn't exist
-        os.makedirs(data_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(user_file), exist_ok=True)
 
-        with open(user_file, 'w') as f:
-            json.dump(users, f, indent=4)
+        # Replace the file atomically so no reader sees a partial table
+        with access_users_lock():
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(user_file), prefix='.access_users.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(users, f, indent=4)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, user_file)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
     except Exception as e:
         logger.error(f"Error saving access users: {e}")
         raise
+    finally:
+        invalidate_access_users()
 
 def init_access_users():
     """Initialize access users with proper error handling"""
     try:
-        data_dir = get_data_dir()
-        user_file = os.path.join(data_dir, 'access_users.json')
+        user_file = access_users_file()
 
         if not os.path.exists(user_file):
             users = [{
@@ -271,26 +331,27 @@ def init_access_routes(app):
                         flash('Username and password are required', 'error')
                         return redirect(url_for('manage_access'))
 
-                    # Load existing users
-                    users = load_access_users()
+                    with access_users_lock():
+                        # Load existing users
+                        users = load_access_users()
 
-                    # Check for duplicate username
-                    if any(user['username'] == username for user in users):
-                        flash('Username already exists', 'error')
-                        return redirect(url_for('manage_access'))
+                        # Check for duplicate username
+                        if any(user['username'] == username for user in users):
+                            flash('Username already exists', 'error')
+                            return redirect(url_for('manage_access'))
 
-                    # Create new user
-                    new_user = {
-                        'id': len(users) + 1,
-                        'username': username,
-                        'password': generate_password_hash(password),
-                        'roles': roles,
-                        'created_at': datetime.now().isoformat()
-                    }
-
-                    # Save updated users list
-                    users.append(new_user)
-                    save_access_users(users)
+                        # Create new user
+                        new_user = {
+                            'id': len(users) + 1,
+                            'username': username,
+                            'password': generate_password_hash(password),
+                            'roles': roles,
+                            'created_at': datetime.now().isoformat()
+                        }
+
+                        # Save updated users list
+                        users.append(new_user)
+                        save_access_users(users)
 
                     flash('User added successfully', 'success')
                     return redirect(url_for('manage_access'))
@@ -316,14 +377,15 @@ def init_access_routes(app):
                 if username == 'admin':
                     return jsonify({'success': False, 'message': 'Cannot delete admin user'}), 400
 
-                users = load_access_users()
-                original_count = len(users)
-                users = [user for user in users if user['username'] != username]
+                with access_users_lock():
+                    users = load_access_users()
+                    original_count = len(users)
+                    users = [user for user in users if user['username'] != username]
 
-                if len(users) == original_count:
-                    return jsonify({'success': False, 'message': 'User not found'}), 404
+                    if len(users) == original_count:
+                        return jsonify({'success': False, 'message': 'User not found'}), 404
 
-                save_access_users(users)
+                    save_access_users(users)
                 return jsonify({'success': True, 'message': 'User deleted successfully'})
 
             except Exception as e:
@@ -339,16 +401,17 @@ def init_access_routes(app):
                     return jsonify({'success': False, 'message': 'Cannot modify admin roles'}), 400
 
                 roles = request.json.get('roles', [])
-                users = load_access_users()
+                with access_users_lock():
+                    users = load_access_users()
 
-                user_index = next((index for index, user in enumerate(users)
-                                if user['username'] == username), None)
+                    user_index = next((index for index, user in enumerate(users)
+                                    if user['username'] == username), None)
 
-                if user_index is None:
-                    return jsonify({'success': False, 'message': 'User not found'}), 404
+                    if user_index is None:
+                        return jsonify({'success': False, 'message': 'User not found'}), 404
 
-                users[user_index]['roles'] = roles
-                save_access_users(users)
+                    users[user_index]['roles'] = roles
+                    save_access_users(users)
 
                 return jsonify({'success': True, 'message': 'Roles updated successfully'})
 
@@ -0,0 +1,233 @@
+# changes.py
+
+from collections import Counter
+import hashlib
+import json
+import logging
+import os
+
+from locks import DatasetLocks
+import serialization
+
+logger = logging.getLogger(__name__)
+
+# Change entries kept per dataset; older cursors get a full snapshot instead
+CHANGE_LOG_RETAIN = 10000
+
+# Fields identifying "the same" record across a rewrite, so that a record
+# replaced in place is reported as an update rather than a delete + insert
+CHANGE_KEYS = {
+    'orderbook': ('Order No.', 'Design No.'),
+    'warping_production': ('beam_no',),
+    'warping_dispatch': ('beam_no',),
+    'sizing_production': ('beam_no',),
+    'sizing_dispatch': ('beam_no',),
+    'grey_production': ('piece_no',),
+    'grey_dispatch': ('piece_no',),
+}
+
+
+class ChangeLog:
+    """Per-dataset sequence of record changes, kept in <changes_dir>/<name>.jsonl.
+
+    Every write made through the DataStore appends one entry per changed
+    record: {"seq": n, "op": "insert"|"update"|"delete", "id": ...,
+    "record": {...}, "previous_id": ...}. seq increases by one per entry
+    and is shared by all worker processes (appends hold the dataset's
+    DatasetLocks lock), so a client holding a cursor only needs the
+    entries after it.
+
+    Records carry no stable ids, so a record's id is a hash of its content
+    plus an occurrence number that tells identical records apart. An update
+    therefore changes the id; previous_id names the record it replaces.
+    """
+
+    def __init__(self, changes_dir, encoder=None, locks=None):
+        self.changes_dir = changes_dir
+        self.encoder = encoder
+        self.locks = locks or DatasetLocks(changes_dir)
+        self._entries = {}  # name -> (file signature, entries)
+        self._counts = {}   # name -> (dataset signature, Counter of content hashes)
+        os.makedirs(changes_dir, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.changes_dir, f'{name}.jsonl')
+
+    def lock(self, name):
+        """Serialize writers of one dataset, across threads and processes"""
+        return self.locks.lock(name)
+
+    def content_hash(self, record):
+        # Stdlib encoding on purpose: ids must not change with whether orjson is installed
+        canonical = json.dumps(record, cls=self.encoder, sort_keys=True)
+        return hashlib.sha1(canonical.encode()).hexdigest()[:16]
+
+    def entries(self, name):
+        """Return the retained change entries of a dataset, oldest first"""
+        try:
+            st = os.stat(self.path(name))
+        except OSError:
+            return []
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        cached = self._entries.get(name)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        entries = []
+        with open(self.path(name), 'r') as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        entries.append(serialization.loads(line))
+                    except json.JSONDecodeError:
+                        logger.error(f"Skipping corrupt change entry in {self.path(name)}")
+        self._entries[name] = (signature, entries)
+        return entries
+
+    def last_seq(self, name):
+        entries = self.entries(name)
+        return entries[-1]['seq'] if entries else 0
+
+    def snapshot_ids(self, records):
+        """Ids of a dataset's records in order, as a snapshot reports them"""
+        seen = Counter()
+        ids = []
+        for record in records:
+            digest = self.content_hash(record)
+            ids.append(f'{digest}:{seen[digest]}')
+            seen[digest] += 1
+        return ids
+
+    def record_append(self, name, old_signature, added, new_signature, load_records):
+        """Log inserts for records appended to a dataset (call under lock()).
+
+        The occurrence counts of the dataset are carried over from the
+        previous write; only when another process wrote in between is the
+        dataset re-read with load_records() (it returns the records after
+        the append).
+        """
+        added_hashes = [self.content_hash(record) for record in added]
+        cached = self._counts.get(name)
+        if cached is not None and cached[0] == old_signature:
+            counts = Counter(cached[1])
+        else:
+            counts = Counter(self.content_hash(record) for record in load_records())
+            counts.subtract(added_hashes)
+        changes = []
+        for record, digest in zip(added, added_hashes):
+            changes.append({'op': 'insert', 'id': f'{digest}:{counts[digest]}', 'record': record})
+            counts[digest] += 1
+        self._append(name, changes)
+        self._counts[name] = (new_signature, counts)
+
+    def record_write(self, name, old_records, new_records, new_signature):
+        """Log the difference between two versions of a dataset (call under lock())"""
+        old_by_hash = {}
+        for record in old_records:
+            old_by_hash.setdefault(self.content_hash(record), []).append(record)
+        counts = Counter({digest: len(records) for digest, records in old_by_hash.items()})
+        remaining = Counter(counts)
+
+        inserted = []
+        for record in new_records:
+            digest = self.content_hash(record)
+            if remaining[digest] > 0:
+                remaining[digest] -= 1
+            else:
+                inserted.append((digest, record))
+
+        # Identical records are interchangeable, so the highest occurrence
+        # numbers are the ones that go
+        deleted = []
+        for digest, missing in remaining.items():
+            for _ in range(missing):
+                counts[digest] -= 1
+                deleted.append((f'{digest}:{counts[digest]}', old_by_hash[digest][0]))
+
+        changes = []
+        keys = CHANGE_KEYS.get(name)
+        replaced = {}
+        if keys:
+            deleted_by_key = {}
+            for record_id, record in deleted:
+                deleted_by_key.setdefault(tuple(str(record.get(k)) for k in keys), []).append(record_id)
+            inserted_by_key = Counter(tuple(str(record.get(k)) for k in keys) for _, record in inserted)
+            replaced = {key: ids[0] for key, ids in deleted_by_key.items()
+                        if len(ids) == 1 and inserted_by_key[key] == 1}
+
+        paired = set(replaced.values())
+        changes.extend({'op': 'delete', 'id': record_id}
+                       for record_id, _ in deleted if record_id not in paired)
+        for digest, record in inserted:
+            change = {'op': 'insert', 'id': f'{digest}:{counts[digest]}', 'record': record}
+            counts[digest] += 1
+            if keys:
+                previous_id = replaced.get(tuple(str(record.get(k)) for k in keys))
+                if previous_id is not None:
+                    change['op'] = 'update'
+                    change['previous_id'] = previous_id
+            changes.append(change)
+
+        self._append(name, changes)
+        self._counts[name] = (new_signature, +counts)
+
+    def _append(self, name, changes):
+        if not changes:
+            return
+        seq = self.last_seq(name)
+        lines = []
+        for change in changes:
+            seq += 1
+            lines.append(serialization.dumps(dict(seq=seq, **change)) + '\n')
+        with open(self.path(name), 'a') as f:
+            f.write(''.join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        if len(self.entries(name)) > 2 * CHANGE_LOG_RETAIN:
+            self._trim(name)
+
+    def _trim(self, name):
+        """Keep only the newest CHANGE_LOG_RETAIN entries"""
+        entries = self.entries(name)[-CHANGE_LOG_RETAIN:]
+        tmp_path = self.path(name) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(''.join(serialization.dumps(entry) + '\n' for entry in entries))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path(name))
+        logger.info(f"Trimmed change log {self.path(name)} to {len(entries)} entries")
+
+    def reset(self, name):
+        """Drop a dataset's entries, leaving a reset marker that sends every client to a snapshot"""
+        seq = self.last_seq(name) + 1
+        tmp_path = self.path(name) + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(serialization.dumps({'seq': seq, 'op': 'reset'}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path(name))
+        self._counts.pop(name, None)
+
+    def since(self, name, cursor, limit=None):
+        """Return the entries after cursor, or None when the log cannot serve it.
+
+        None means the cursor is negative, older than the retained entries,
+        falls before a reset marker, or is ahead of the log, and the client
+        needs a snapshot.
+        """
+        entries = self.entries(name)
+        if not entries:
+            return [] if cursor == 0 else None
+        last = entries[-1]['seq']
+        if cursor < 0 or cursor > last:
+            return None
+        if cursor == last:
+            return []
+        first = entries[0]['seq']
+        if cursor < first - 1:
+            return None
+        start = cursor - first + 1
+        if entries[start]['op'] == 'reset':
+            return None
+        end = None if limit is None else start + limit
+        return entries[start:end]
@@ -0,0 +1,109 @@
+# coalescer.py
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Seconds the first insert of a batch waits for others to join it
+COALESCE_WINDOW = 0.005
+
+
+class InsertRejected(Exception):
+    """An insert refused by its check; the message is meant for the client"""
+
+
+class WriteCoalescer:
+    """Group commit for inserts into a DataStore.
+
+    Requests inserting into the same dataset within `window` seconds of each
+    other are merged: the first to arrive becomes the batch leader, waits
+    out the window, then takes the dataset lock once, runs every queued
+    insert's check in arrival order and appends the accepted records with a
+    single store.append() (one rewrite and one fsync). Each caller of
+    insert() returns only after its batch is durable.
+
+    A check is called as check(batch) with the records accepted earlier in
+    the same batch, which are not yet visible through the store, and
+    returns an error message to reject the insert or None to accept it.
+    Callers must not hold the dataset's store.lock() themselves, since the
+    batch may be committed by another request's thread.
+    """
+
+    def __init__(self, store, window=COALESCE_WINDOW):
+        self.store = store
+        self.window = window
+        self._guard = threading.Lock()
+        self._queues = {}  # name -> list of pending inserts
+        self._leaders = set()
+        self.batches = 0
+        self.inserts = 0
+
+    def insert(self, name, records, check=None):
+        """Queue records for a dataset and wait until they are written.
+
+        Raises InsertRejected when check refused them, or the error the
+        write itself failed with.
+        """
+        item = {'records': list(records), 'check': check, 'wake': threading.Event(),
+                'lead': False, 'done': False, 'error': None}
+        with self._guard:
+            self._queues.setdefault(name, []).append(item)
+            if name not in self._leaders:
+                self._leaders.add(name)
+                item['lead'] = True
+
+        while not item['done']:
+            if item['lead']:
+                self._lead(name)
+            else:
+                item['wake'].wait()
+        if item['error'] is not None:
+            raise item['error']
+
+    def _lead(self, name):
+        """Commit the queued batch, then hand leadership to the next waiter"""
+        if self.window:
+            time.sleep(self.window)
+        with self._guard:
+            batch = self._queues.pop(name, [])
+        self._commit(name, batch)
+        with self._guard:
+            queue = self._queues.get(name)
+            if queue:
+                queue[0]['lead'] = True
+                queue[0]['wake'].set()
+            else:
+                self._leaders.discard(name)
+
+    def _commit(self, name, batch):
+        accepted = []
+        try:
+            with self.store.lock(name):
+                for item in batch:
+                    try:
+                        error = item['check'](accepted) if item['check'] else None
+                    except Exception as e:
+                        item['error'] = e
+                        continue
+                    if error:
+                        item['error'] = InsertRejected(error)
+                    else:
+                        accepted.extend(item['records'])
+                if accepted:
+                    self.store.append(name, accepted)
+            committed = sum(1 for item in batch if item['error'] is None)
+            self.batches += 1
+            self.inserts += committed
+            if len(batch) > 1:
+                logger.debug(f"Committed {committed} of {len(batch)} {name} inserts in one write")
+        except Exception as e:
+            logger.error(f"Error committing {len(batch)} {name} inserts: {e}")
+            for item in batch:
+                if item['error'] is None:
+                    item['error'] = e
+        finally:
+            for item in batch:
+                item['done'] = True
+                item['wake'].set()
@@ -0,0 +1,867 @@
+# datastore.py
+
+from contextlib import nullcontext
+from datetime import datetime, timezone
+import gzip
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+import logging
+
+from changes import ChangeLog
+from locks import DatasetLocks
+import serialization
+
+logger = logging.getLogger(__name__)
+
+# Production stage files that the 'jsonl' engine keeps as append-only logs.
+# The orderbook and user files are mostly rewritten rather than appended
+# to, so they stay plain JSON.
+STAGE_DATASETS = [
+    'warping_production', 'warping_dispatch', 'sizing_production',
+    'sizing_dispatch', 'initiate_beam', 'beam_on_loom', 'unit259_production',
+    'grey_production', 'grey_dispatch'
+]
+
+# Archives that are only ever appended to (closed orders leave the orderbook
+# for good); the file engines keep them as append-only logs so archiving
+# does not rewrite everything archived before
+ARCHIVE_DATASETS = ['orders_closed']
+
+# Datasets the 'json' engine stores as monthly partitions, with the record
+# field (YYYY-MM-DD...) that picks each record's month
+PARTITIONED_DATASETS = {
+    'grey_production': 'date',
+    'grey_dispatch': 'date',
+    'unit259_production': 'date',
+}
+PARTITION_KEY_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+UNDATED_PARTITION = 'undated'
+
+# Compact a log once it holds this many more entries than live records
+COMPACT_MIN_GARBAGE = 1000
+
+SQLITE_FILENAME = 'shopfloor.db'
+
+# Indexed lookup columns of the SQLite tables and the record keys they are
+# filled from (stage files use snake_case, the orderbook uses sheet headers)
+SQLITE_KEY_COLUMNS = {
+    'beam_no': ('beam_no',),
+    'loom_no': ('loom_no',),
+    'piece_no': ('piece_no',),
+    'order_no': ('order_no', 'Order No.'),
+    'design_no': ('design_no', 'Design No.')
+}
+
+
+class JsonFileBackend:
+    """Stores each dataset as a single JSON array in <name>.json.
+
+    Files are written compact unless pretty is set (JSON_PRETTY=1), which
+    indents them for reading by hand at the cost of size and speed.
+    """
+
+    suffix = '.json'
+
+    def __init__(self, data_dir, encoder=None, pretty=False):
+        self.data_dir = data_dir
+        self.encoder = encoder
+        self.pretty = pretty
+
+    def path(self, name):
+        return os.path.join(self.data_dir, f'{name}{self.suffix}')
+
+    def signature(self, name):
+        """Return the (mtime_ns, size, inode) signature of a dataset, or None if missing"""
+        try:
+            st = os.stat(self.path(name))
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def modified(self, name):
+        """Return the time the dataset was last written (epoch seconds), or None"""
+        try:
+            return os.stat(self.path(name)).st_mtime
+        except OSError:
+            return None
+
+    def load(self, name):
+        try:
+            with open(self.path(name), 'rb') as f:
+                return serialization.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return []
+
+    def save(self, name, records):
+        """Write the dataset to a temporary file and rename it over the old one.
+
+        Readers see either the old or the new file, never a partial one, and
+        the data is on disk before the rename makes it visible.
+        """
+        path = self.path(name)
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_dir, prefix=f'.{name}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(serialization.dumps(records, pretty=self.pretty))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def append(self, name, records):
+        self.save(name, self.load(name) + list(records))
+
+    def canonical(self, record):
+        """Serialize a record so that equal records give equal strings"""
+        return json.dumps(record, cls=self.encoder, sort_keys=True)
+
+
+class JsonLinesBackend(JsonFileBackend):
+    """Stores each dataset as an append-only log of JSON lines in <name>.jsonl.
+
+    Every line is either {"op": "put", "id": n, "record": {...}} or
+    {"op": "del", "id": n}. Inserts append put entries, and a full rewrite
+    is turned into the put/del entries that differ from the current state,
+    so the cost of a write no longer grows with the size of the file.
+    Once the log carries enough dead entries it is folded into a snapshot
+    of put entries by a background compaction thread.
+
+    Each dataset's replayed state is kept in memory together with the file
+    offset it was read up to, so picking up records appended by another
+    worker only reads the new tail of the log.
+    """
+
+    suffix = '.jsonl'
+
+    def __init__(self, data_dir, encoder=None, locks=None):
+        super().__init__(data_dir, encoder)
+        self.locks = locks
+        self._states = {}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._compacting = set()
+
+    def _lock(self, name):
+        with self._locks_guard:
+            return self._locks.setdefault(name, threading.RLock())
+
+    def _encode(self, entry):
+        return serialization.dumps(entry)
+
+    def _import_legacy(self, name):
+        """Seed a new log from an existing <name>.json file"""
+        legacy = JsonFileBackend(self.data_dir, self.encoder)
+        if not os.path.exists(legacy.path(name)):
+            return
+        records = legacy.load(name)
+        self._write_snapshot(name, dict(enumerate(records, start=1)))
+        logger.info(f"Imported {len(records)} records from {legacy.path(name)} into {self.path(name)}")
+
+    def _write_snapshot(self, name, rows):
+        path = self.path(name)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            for row_id, record in rows.items():
+                f.write(self._encode({'op': 'put', 'id': row_id, 'record': record}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def signature(self, name):
+        if not os.path.exists(self.path(name)):
+            with self._lock(name):
+                if not os.path.exists(self.path(name)):
+                    self._import_legacy(name)
+        return super().signature(name)
+
+    def _state(self, name):
+        """Replay any log entries not yet seen and return the dataset state"""
+        path = self.path(name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            self._states.pop(name, None)
+            return {'rows': {}, 'next_id': 1, 'entries': 0}
+
+        state = self._states.get(name)
+        if state is None or state['inode'] != st.st_ino or st.st_size < state['offset']:
+            state = {'inode': st.st_ino, 'offset': 0, 'rows': {}, 'next_id': 1, 'entries': 0}
+            self._states[name] = state
+
+        if st.st_size > state['offset']:
+            with open(path, 'rb') as f:
+                f.seek(state['offset'])
+                chunk = f.read()
+            # Only consume complete lines; a writer may be mid-append
+            end = chunk.rfind(b'\n') + 1
+            for line in chunk[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    entry = serialization.loads(line)
+                except json.JSONDecodeError:
+                    logger.error(f"Skipping corrupt log entry in {path}")
+                    continue
+                row_id = entry.get('id')
+                if entry.get('op') == 'put':
+                    state['rows'][row_id] = entry.get('record')
+                elif entry.get('op') == 'del':
+                    state['rows'].pop(row_id, None)
+                state['next_id'] = max(state['next_id'], (row_id or 0) + 1)
+                state['entries'] += 1
+            state['offset'] += end
+        return state
+
+    def _append_entries(self, name, entries):
+        if not entries:
+            return
+        data = ''.join(self._encode(entry) + '\n' for entry in entries).encode()
+        with open(self.path(name), 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        # Replay from our last offset, which folds in our own entries as
+        # stored (and anything another worker appended just before them)
+        state = self._state(name)
+        self._maybe_compact(name, state)
+
+    def load(self, name):
+        with self._lock(name):
+            return list(self._state(name)['rows'].values())
+
+    def save(self, name, records):
+        with self._lock(name):
+            state = self._state(name)
+            # Match unchanged records by content so only the difference is logged
+            existing = {}
+            for row_id, record in state['rows'].items():
+                existing.setdefault(self.canonical(record), []).append(row_id)
+
+            entries = []
+            for record in records:
+                ids = existing.get(self.canonical(record))
+                if ids:
+                    ids.pop(0)
+                    continue
+                entries.append({'op': 'put', 'id': state['next_id'], 'record': record})
+                state['next_id'] += 1
+            for ids in existing.values():
+                entries.extend({'op': 'del', 'id': row_id} for row_id in ids)
+
+            self._append_entries(name, entries)
+
+    def append(self, name, records):
+        with self._lock(name):
+            state = self._state(name)
+            entries = []
+            for record in records:
+                entries.append({'op': 'put', 'id': state['next_id'], 'record': record})
+                state['next_id'] += 1
+            self._append_entries(name, entries)
+
+    def _maybe_compact(self, name, state):
+        garbage = state['entries'] - len(state['rows'])
+        if garbage < max(COMPACT_MIN_GARBAGE, len(state['rows'])) or name in self._compacting:
+            return
+        self._compacting.add(name)
+        threading.Thread(target=self.compact, args=(name,), daemon=True).start()
+
+    def compact(self, name):
+        """Fold a dataset's log into a snapshot holding only live records"""
+        try:
+            # Hold the dataset lock too, so no worker appends to the log
+            # while it is being replaced
+            with self.locks.lock(name) if self.locks else nullcontext(), self._lock(name):
+                state = self._state(name)
+                rows = dict(state['rows'])
+                self._write_snapshot(name, rows)
+                st = os.stat(self.path(name))
+                self._states[name] = {
+                    'inode': st.st_ino,
+                    'offset': st.st_size,
+                    'rows': rows,
+                    'next_id': state['next_id'],
+                    'entries': len(rows)
+                }
+            logger.info(f"Compacted {self.path(name)} to {len(rows)} records")
+        except Exception as e:
+            logger.error(f"Error compacting {name}: {e}")
+        finally:
+            self._compacting.discard(name)
+
+
+class PartitionedBackend(JsonFileBackend):
+    """Stores a dataset as one JSON array per month in <name>/<YYYY-MM>.json.
+
+    Records go to the month of their date field (PARTITIONED_DATASETS);
+    records without a usable date go to <name>/undated.json. An insert
+    rewrites only its month's file, and load_range() reads only the months
+    a date range overlaps. Parsed partitions are cached by file signature,
+    so a full load after a write re-parses just the partition that changed.
+
+    Months before the previous one are frozen: their files are made
+    read-only and, with compress set (PARTITION_COMPRESS=1), gzipped to
+    <YYYY-MM>.json.gz. A backdated record is still accepted; its frozen
+    partition is replaced (atomically, like every write) and frozen again.
+    """
+
+    def __init__(self, data_dir, encoder=None, pretty=False, compress=False):
+        super().__init__(data_dir, encoder, pretty)
+        self.compress = compress
+        self._partitions = {}  # (name, filename) -> (file signature, records)
+        self._import_lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.data_dir, name)
+
+    def partition_key(self, name, record):
+        """YYYY-MM of a record's date field, or 'undated'"""
+        key = str(record.get(PARTITIONED_DATASETS[name]) or '')[:7]
+        return key if PARTITION_KEY_PATTERN.match(key) else UNDATED_PARTITION
+
+    def _group(self, name, records):
+        groups = {}
+        for record in records:
+            groups.setdefault(self.partition_key(name, record), []).append(record)
+        return groups
+
+    def _files(self, name):
+        """{partition key: filename} of a dataset, in key order ('undated' last)"""
+        try:
+            filenames = os.listdir(self.path(name))
+        except FileNotFoundError:
+            return {}
+        files = {}
+        for filename in filenames:
+            if filename.endswith('.json.gz'):
+                files[filename[:-len('.json.gz')]] = filename
+            elif filename.endswith('.json'):
+                files.setdefault(filename[:-len('.json')], filename)
+        return dict(sorted(files.items()))
+
+    def _import_legacy(self, name):
+        """Split an existing <name>.json file into monthly partitions"""
+        legacy = JsonFileBackend(self.data_dir, self.encoder)
+        if not os.path.exists(legacy.path(name)):
+            return
+        records = legacy.load(name)
+        tmp_dir = tempfile.mkdtemp(dir=self.data_dir, prefix=f'.{name}.')
+        for key, group in self._group(name, records).items():
+            with open(os.path.join(tmp_dir, f'{key}.json'), 'w') as f:
+                f.write(serialization.dumps(group, pretty=self.pretty))
+        with open(os.path.join(tmp_dir, '.version'), 'w') as f:
+            f.write(uuid.uuid4().hex)
+        try:
+            os.rename(tmp_dir, self.path(name))
+        except OSError:
+            # Another worker imported it first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return
+        logger.info(f"Split {len(records)} records from {legacy.path(name)} into monthly partitions")
+
+    def _version_path(self, name):
+        return os.path.join(self.path(name), '.version')
+
+    def _bump(self, name):
+        """Replace the dataset's .version file; its new inode marks the write"""
+        os.makedirs(self.path(name), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path(name), prefix='.version.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_path, self._version_path(name))
+
+    def signature(self, name):
+        """Signature of the dataset's .version file, which every write replaces"""
+        if not os.path.exists(self.path(name)):
+            with self._import_lock:
+                if not os.path.exists(self.path(name)):
+                    self._import_legacy(name)
+        try:
+            st = os.stat(self._version_path(name))
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def modified(self, name):
+        try:
+            return os.stat(self._version_path(name)).st_mtime
+        except OSError:
+            return None
+
+    def _read(self, name, filename):
+        path = os.path.join(self.path(name), filename)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return []
+        signature = (st.st_mtime_ns, st.st_size, st.st_ino)
+        cached = self._partitions.get((name, filename))
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        opener = gzip.open if filename.endswith('.gz') else open
+        try:
+            with opener(path, 'rb') as f:
+                records = serialization.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            records = []
+        self._partitions[(name, filename)] = (signature, records)
+        return records
+
+    def load(self, name):
+        records = []
+        for filename in self._files(name).values():
+            records.extend(self._read(name, filename))
+        return records
+
+    def load_range(self, name, start=None, end=None):
+        """Records of the months overlapping [start, end] (datetimes, None for open)"""
+        first = start.strftime('%Y-%m') if start else None
+        last = end.strftime('%Y-%m') if end else None
+        records = []
+        for key, filename in self._files(name).items():
+            if key == UNDATED_PARTITION or (first and key < first) or (last and key > last):
+                continue
+            records.extend(self._read(name, filename))
+        return records
+
+    def _frozen_before(self):
+        """Partition keys below this one are frozen (everything before last month)"""
+        today = datetime.now()
+        year, month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+        return f'{year:04d}-{month:02d}'
+
+    def _write_partition(self, name, key, records):
+        directory = self.path(name)
+        os.makedirs(directory, exist_ok=True)
+        frozen = key != UNDATED_PARTITION and key < self._frozen_before()
+        compressed = frozen and self.compress
+        filename = f'{key}.json.gz' if compressed else f'{key}.json'
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{key}.', suffix='.tmp')
+        try:
+            data = serialization.dumps(records, pretty=self.pretty).encode()
+            with os.fdopen(fd, 'wb') as f:
+                if compressed:
+                    with gzip.GzipFile(fileobj=f, mode='wb', mtime=0) as gz:
+                        gz.write(data)
+                else:
+                    f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if frozen:
+                os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, os.path.join(directory, filename))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        other = f'{key}.json' if compressed else f'{key}.json.gz'
+        if os.path.exists(os.path.join(directory, other)):
+            os.remove(os.path.join(directory, other))
+
+    def freeze(self, name):
+        """Make partitions older than last month read-only (and gzipped when compressing)"""
+        cutoff = self._frozen_before()
+        for key, filename in self._files(name).items():
+            if key == UNDATED_PARTITION or key >= cutoff:
+                continue
+            path = os.path.join(self.path(name), filename)
+            if os.stat(path).st_mode & 0o222 or (self.compress and not filename.endswith('.gz')):
+                self._write_partition(name, key, self._read(name, filename))
+                logger.info(f"Froze partition {name}/{key}")
+
+    def save(self, name, records):
+        files = self._files(name)
+        groups = self._group(name, records)
+        for key, group in groups.items():
+            if key not in files or self._read(name, files[key]) != group:
+                self._write_partition(name, key, group)
+        for key, filename in files.items():
+            if key not in groups:
+                os.remove(os.path.join(self.path(name), filename))
+        self.freeze(name)
+        self._bump(name)
+
+    def append(self, name, records):
+        files = self._files(name)
+        for key, group in self._group(name, records).items():
+            existing = self._read(name, files[key]) if key in files else []
+            self._write_partition(name, key, existing + group)
+        self.freeze(name)
+        self._bump(name)
+
+
+class SqliteBackend(JsonFileBackend):
+    """Stores every dataset as a table in a single SQLite database (WAL mode).
+
+    Each table keeps the full record as JSON next to indexed copies of the
+    lookup keys in SQLITE_KEY_COLUMNS, so find() is an index lookup rather
+    than a scan. A per-dataset version counter, bumped in the same
+    transaction as each write, serves as the cache signature.
+    """
+
+    def __init__(self, data_dir, encoder=None):
+        super().__init__(data_dir, encoder)
+        self.db_path = os.path.join(data_dir, SQLITE_FILENAME)
+        self._local = threading.local()
+        self._tables = set()
+
+    def path(self, name):
+        return self.db_path
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS dataset_versions '
+                '(name TEXT PRIMARY KEY, version INTEGER NOT NULL, modified_at REAL)'
+            )
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(dataset_versions)')]
+            if 'modified_at' not in columns:
+                conn.execute('ALTER TABLE dataset_versions ADD COLUMN modified_at REAL')
+            self._local.conn = conn
+        return conn
+
+    def _table(self, name):
+        if not re.fullmatch(r'[A-Za-z0-9_]+', name):
+            raise ValueError(f'Invalid dataset name: {name}')
+        if name not in self._tables:
+            conn = self._connect()
+            key_columns = ', '.join(f'{col} {"INTEGER" if col == "loom_no" else "TEXT"}'
+                                    for col in SQLITE_KEY_COLUMNS)
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{name}" '
+                         f'(id INTEGER PRIMARY KEY AUTOINCREMENT, {key_columns}, record TEXT NOT NULL)')
+            for col in ('beam_no', 'loom_no', 'piece_no'):
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}_{col}" '
+                             f'ON "{name}" ({col}) WHERE {col} IS NOT NULL')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}_order_design" '
+                         f'ON "{name}" (order_no, design_no) WHERE order_no IS NOT NULL')
+            self._tables.add(name)
+        return f'"{name}"'
+
+    def _row(self, record):
+        keys = []
+        for col, fields in SQLITE_KEY_COLUMNS.items():
+            value = next((record.get(f) for f in fields if record.get(f) is not None), None)
+            if value is not None and col != 'loom_no':
+                value = str(value)
+            elif value is not None:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    value = None
+            keys.append(value)
+        return keys + [serialization.dumps(record)]
+
+    def signature(self, name):
+        row = self._connect().execute(
+            'SELECT version FROM dataset_versions WHERE name = ?', (name,)
+        ).fetchone()
+        return ('sqlite', row[0]) if row else None
+
+    def modified(self, name):
+        row = self._connect().execute(
+            'SELECT modified_at FROM dataset_versions WHERE name = ?', (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def load(self, name):
+        table = self._table(name)
+        rows = self._connect().execute(f'SELECT record FROM {table} ORDER BY id')
+        return [serialization.loads(record) for (record,) in rows]
+
+    def find(self, name, field, value):
+        """Return the records whose indexed key column equals value"""
+        if field not in SQLITE_KEY_COLUMNS:
+            raise ValueError(f'{field} is not an indexed column')
+        table = self._table(name)
+        if field != 'loom_no':
+            value = str(value)
+        rows = self._connect().execute(
+            f'SELECT record FROM {table} WHERE {field} = ? ORDER BY id', (value,)
+        )
+        return [serialization.loads(record) for (record,) in rows]
+
+    def _write(self, name, delete_ids, records):
+        table = self._table(name)
+        conn = self._connect()
+        placeholders = ', '.join('?' * (len(SQLITE_KEY_COLUMNS) + 1))
+        columns = ', '.join(list(SQLITE_KEY_COLUMNS) + ['record'])
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(f'DELETE FROM {table} WHERE id = ?', ((i,) for i in delete_ids))
+            conn.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})',
+                             (self._row(r) for r in records))
+            conn.execute(
+                'INSERT INTO dataset_versions (name, version, modified_at) VALUES (?, 1, ?) '
+                'ON CONFLICT(name) DO UPDATE SET version = version + 1, '
+                'modified_at = excluded.modified_at', (name, time.time())
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def save(self, name, records):
+        # Only touch the rows that differ from what is stored
+        table = self._table(name)
+        existing = {}
+        for row_id, record in self._connect().execute(f'SELECT id, record FROM {table}'):
+            existing.setdefault(self.canonical(serialization.loads(record)), []).append(row_id)
+
+        inserts = []
+        for record in records:
+            ids = existing.get(self.canonical(record))
+            if ids:
+                ids.pop(0)
+            else:
+                inserts.append(record)
+        self._write(name, [i for ids in existing.values() for i in ids], inserts)
+
+    def append(self, name, records):
+        self._write(name, [], list(records))
+
+
+class DataStore:
+    """Read/write access to the datasets in DATA_DIR with an in-process cache.
+
+    Parsed datasets are cached per dataset and keyed by the backing file's
+    (mtime_ns, size, inode) signature, so a file rewritten by another worker
+    is picked up on the next read. Writes made through this store drop the
+    cached entry straight away and are reported to listeners (see
+    add_listener) so derived indexes can follow them incrementally.
+
+    engine selects how datasets are stored: 'json' (one JSON array per
+    file, the PARTITIONED_DATASETS split by month, see PartitionedBackend),
+    'jsonl' (stage files as append-only logs, see JsonLinesBackend) or
+    'sqlite' (every dataset in one database, see SqliteBackend). Both file
+    engines keep the ARCHIVE_DATASETS as append-only logs.
+    """
+
+    def __init__(self, data_dir, encoder=None, engine='json', pretty=False, compress_partitions=False):
+        self.data_dir = data_dir
+        self.encoder = encoder
+        self.engine = engine
+        self.locks = DatasetLocks(os.path.join(data_dir, 'changes'))
+        self.default_backend = JsonFileBackend(data_dir, encoder, pretty)
+        self.backends = {}
+        if engine == 'jsonl':
+            log_backend = JsonLinesBackend(data_dir, encoder, self.locks)
+            self.backends.update({name: log_backend for name in STAGE_DATASETS + ARCHIVE_DATASETS})
+        elif engine == 'sqlite':
+            self.default_backend = SqliteBackend(data_dir, encoder)
+        elif engine == 'json':
+            partitioned = PartitionedBackend(data_dir, encoder, pretty, compress_partitions)
+            self.backends.update({name: partitioned for name in PARTITIONED_DATASETS})
+            log_backend = JsonLinesBackend(data_dir, encoder, self.locks)
+            self.backends.update({name: log_backend for name in ARCHIVE_DATASETS})
+        else:
+            raise ValueError(f'Unknown storage engine: {engine}')
+
+        self.changes = ChangeLog(os.path.join(data_dir, 'changes'), encoder, self.locks)
+        self._cache = {}  # name -> (signature, records)
+        self._lock = threading.Lock()
+        self._listeners = []
+        self.hits = 0
+        self.misses = 0
+
+    def backend(self, name):
+        return self.backends.get(name, self.default_backend)
+
+    def path(self, name):
+        return self.backend(name).path(name)
+
+    def signature(self, name):
+        return self.backend(name).signature(name)
+
+    def version(self, name):
+        """Return a token that changes with every write to a dataset, or None if missing.
+
+        It is derived from the backend signature (file stat, or the SQLite
+        version counter), so it costs no parsing.
+        """
+        signature = self.signature(name)
+        if signature is None:
+            return None
+        return '-'.join(str(part) for part in signature)
+
+    def modified(self, name):
+        """Return when a dataset was last written as a UTC datetime, or None"""
+        modified = self.backend(name).modified(name)
+        if modified is None:
+            return None
+        return datetime.fromtimestamp(modified, timezone.utc)
+
+    def read_shared(self, name):
+        """Return the cached records for a dataset.
+
+        The returned list is shared with the cache and must not be mutated;
+        use read() when the caller needs to modify the records.
+        """
+        backend = self.backend(name)
+        signature = backend.signature(name)
+        if signature is None:
+            return []
+
+        with self._lock:
+            entry = self._cache.get(name)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        records = backend.load(name)
+        with self._lock:
+            self._cache[name] = (signature, records)
+        return records
+
+    def read_range(self, name, start=None, end=None):
+        """Return the records that may fall in [start, end] (datetimes, None for open).
+
+        Partitioned datasets read only the months the range overlaps; other
+        datasets return everything. Either way the caller filters by day.
+        The returned list must not be mutated.
+        """
+        backend = self.backend(name)
+        if (start is None and end is None) or not hasattr(backend, 'load_range'):
+            return self.read_shared(name)
+        if backend.signature(name) is None:
+            return []
+        return backend.load_range(name, start, end)
+
+    def read(self, name):
+        """Return a private copy of a dataset that the caller may modify.
+
+        Each record is copied one level deep, which covers the way routes
+        update records in place (assigning or updating top-level keys).
+        """
+        return [dict(r) if isinstance(r, dict) else r for r in self.read_shared(name)]
+
+    def write(self, name, data):
+        """Replace a dataset, log what changed and drop its cached copy"""
+        with self.locks.lock(name):
+            old_signature = self.signature(name)
+            old_records = self.read_shared(name)
+            try:
+                self.backend(name).save(name, data)
+            finally:
+                self.invalidate(name)
+            new_signature = self.signature(name)
+            self._log_changes(name, lambda: self.changes.record_write(
+                name, old_records, data, new_signature))
+            self._notify(name, None, old_signature, new_signature)
+
+    def append(self, name, records):
+        """Add records to a dataset, log them and drop its cached copy"""
+        records = list(records)
+        with self.locks.lock(name):
+            old_signature = self.signature(name)
+            try:
+                self.backend(name).append(name, records)
+            finally:
+                self.invalidate(name)
+            new_signature = self.signature(name)
+            self._log_changes(name, lambda: self.changes.record_append(
+                name, old_signature, records, new_signature, lambda: self.read_shared(name)))
+            self._notify(name, records, old_signature, new_signature)
+
+    def lock(self, name):
+        """Hold a dataset's writer lock across a read-modify-write sequence.
+
+        write() and append() take the same (reentrant) lock, so they can be
+        called inside it; other threads and worker processes wait.
+        """
+        return self.locks.lock(name)
+
+    def lock_stats(self):
+        return self.locks.stats()
+
+    def _log_changes(self, name, log):
+        """Run log() against the change log.
+
+        If it fails the dataset's change log is reset, so clients holding a
+        cursor fall back to a full snapshot instead of missing changes.
+        """
+        try:
+            log()
+        except Exception as e:
+            logger.error(f"Error logging changes for {name}, resetting its change log: {e}")
+            self.changes.reset(name)
+
+    def snapshot(self, name):
+        """Return (change cursor, records) for a dataset, consistent with each other"""
+        with self.locks.lock(name):
+            return self.changes.last_seq(name), self.read_shared(name)
+
+    def add_listener(self, listener):
+        """Register listener(name, added, old_signature, new_signature) for writes.
+
+        added is the list of appended records, or None when the dataset was
+        replaced wholesale and listeners must re-read it. Listeners run while
+        the dataset's writer lock is still held, so new_signature is the
+        dataset right after this write and not after a later one by another
+        worker; they must not block on other datasets' locks.
+        """
+        self._listeners.append(listener)
+
+    def _notify(self, name, added, old_signature, new_signature):
+        for listener in self._listeners:
+            try:
+                listener(name, added, old_signature, new_signature)
+            except Exception as e:
+                logger.error(f"Error in write listener for {name}: {e}")
+
+    def find(self, name, field, value):
+        """Return the records of a dataset whose field equals value.
+
+        Uses the backend's index when it has one (SQLite), otherwise scans
+        the cached dataset.
+        """
+        backend = self.backend(name)
+        if hasattr(backend, 'find') and field in SQLITE_KEY_COLUMNS:
+            return backend.find(name, field, value)
+        fields = SQLITE_KEY_COLUMNS.get(field, (field,))
+        return [dict(r) for r in self.read_shared(name)
+                if any(r.get(f) is not None and str(r.get(f)) == str(value) for f in fields)]
+
+    def migrate(self, names, source_engine='json'):
+        """Copy datasets from another engine's files into this store's backends"""
+        source = DataStore(self.data_dir, self.encoder, engine=source_engine)
+        counts = {}
+        for name in names:
+            if source.signature(name) is None:
+                continue
+            records = source.read_shared(name)
+            self.write(name, records)
+            counts[name] = len(records)
+        return counts
+
+    def invalidate(self, name=None):
+        """Drop one cached dataset, or all of them when name is None"""
+        with self._lock:
+            if name is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(name, None)
+
+    def stats(self):
+        """Return cache hit/miss counters"""
+        with self._lock:
+            return {
+                'engine': self.engine,
+                'hits': self.hits,
+                'misses': self.misses,
+                'cached_datasets': len(self._cache)
+            }
@@ -0,0 +1,174 @@
+# events.py
+
+from collections import deque
+import itertools
+import logging
+import threading
+import time
+import uuid
+
+import serialization
+
+logger = logging.getLogger(__name__)
+
+# Events kept for clients that reconnect with a Last-Event-ID
+REPLAY_BUFFER_SIZE = 1000
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = 15
+# Seconds a stream stays open before it is closed so the worker serving it
+# is freed; the browser reconnects with Last-Event-ID and misses nothing
+STREAM_MAX_AGE = 300
+# Seconds between checks of the change log for writes made by other workers
+CHANGE_POLL_INTERVAL = 2
+
+# Live event published for records appended to each dataset
+DATASET_EVENTS = {
+    'beam_on_loom': 'loom-status',
+    'initiate_beam': 'initiate-beam',
+    'unit259_production': 'unit259-production',
+    'grey_production': 'grey-production',
+    'grey_dispatch': 'grey-dispatch',
+}
+
+
+class EventBus:
+    """Publish/subscribe for Server-Sent Events.
+
+    Every published event gets an id "<epoch>-<n>", where epoch identifies
+    this process's bus, and is kept in a bounded replay buffer. A client
+    reconnecting with Last-Event-ID gets the events it missed; when those
+    are no longer buffered (or the id is from another process or an earlier
+    run) it gets a "reset" event telling it to reload instead.
+
+    Given the store's ChangeLog, the bus publishes from the change log
+    rather than from the writes it is told about, so records written by
+    any worker reach the streams of every worker: local writes are picked
+    up at once, other workers' within CHANGE_POLL_INTERVAL. Without one,
+    only writes made in this process are published.
+    """
+
+    def __init__(self, changes=None, buffer_size=REPLAY_BUFFER_SIZE, poll_interval=CHANGE_POLL_INTERVAL):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.changes = changes
+        self.poll_interval = poll_interval
+        self._seq = itertools.count(1)
+        self._buffer = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._synced_at = time.monotonic()
+        # Change log position published up to, per dataset; history is not replayed
+        self._cursors = {name: changes.last_seq(name) for name in DATASET_EVENTS} if changes else {}
+
+    def publish(self, event, data):
+        with self._condition:
+            seq = next(self._seq)
+            self._buffer.append((seq, event, serialization.dumps(data)))
+            self._condition.notify_all()
+        return f'{self.epoch}-{seq}'
+
+    def _parse_id(self, last_event_id):
+        """Sequence number of a Last-Event-ID from this bus, else None"""
+        epoch, _, seq = (last_event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        return int(seq)
+
+    def _frame(self, seq, event, data):
+        return f'id: {self.epoch}-{seq}\nevent: {event}\ndata: {data}\n\n'
+
+    def stream(self, events=None, last_event_id=None, heartbeat=HEARTBEAT_INTERVAL, max_age=STREAM_MAX_AGE):
+        """Yield SSE frames for the given event types (all when None) for max_age seconds.
+
+        The stream ends with an id-only frame carrying its position, so the
+        EventSource reconnects with a Last-Event-ID that covers the events
+        it skipped as filtered out.
+        """
+        closes_at = time.monotonic() + max_age
+        with self._condition:
+            last_seq = self._buffer[-1][0] if self._buffer else 0
+            if last_event_id:
+                seq = self._parse_id(last_event_id)
+                oldest = self._buffer[0][0] if self._buffer else last_seq + 1
+                if seq is None or seq < oldest - 1 or seq > last_seq:
+                    pending = [(last_seq, 'reset', serialization.dumps({'reason': 'missed events'}))]
+                else:
+                    pending = [item for item in self._buffer if item[0] > seq]
+                    last_seq = seq
+            else:
+                pending = []
+
+        # Tell the browser how long to wait before reconnecting
+        yield 'retry: 3000\n\n'
+        while True:
+            for seq, event, data in pending:
+                last_seq = max(last_seq, seq)
+                if events is None or event in events or event == 'reset':
+                    yield self._frame(seq, event, data)
+
+            now = time.monotonic()
+            if now >= closes_at:
+                yield f'id: {self.epoch}-{last_seq}\n\n'
+                return
+            deadline = min(now + heartbeat, closes_at)
+            while True:
+                self.poll()
+                with self._condition:
+                    if self._buffer and self._buffer[-1][0] > last_seq:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(min(remaining, self.poll_interval) if self.changes else remaining)
+            with self._condition:
+                oldest = self._buffer[0][0] if self._buffer else last_seq + 1
+                if oldest > last_seq + 1:
+                    # This client fell behind the replay buffer
+                    pending = [(self._buffer[-1][0], 'reset', serialization.dumps({'reason': 'missed events'}))]
+                else:
+                    pending = [item for item in self._buffer if item[0] > last_seq]
+            if not pending and time.monotonic() < closes_at:
+                yield ': keep-alive\n\n'
+
+    def poll(self):
+        """Publish other workers' writes, at most once per poll_interval"""
+        if self.changes is None or time.monotonic() - self._synced_at < self.poll_interval:
+            return
+        self.sync(DATASET_EVENTS)
+
+    def sync(self, names):
+        """Publish the change log entries of the given datasets not published yet"""
+        with self._sync_lock:
+            self._synced_at = time.monotonic()
+            for name in names:
+                cursor = self._cursors.get(name, 0)
+                entries = self.changes.since(name, cursor)
+                if entries is None:
+                    # Log trimmed or reset past our cursor: clients must reload
+                    self._cursors[name] = self.changes.last_seq(name)
+                    self.publish('dataset-changed', {'dataset': name})
+                    continue
+                changed = False
+                for entry in entries:
+                    if entry['op'] == 'insert':
+                        self.publish(DATASET_EVENTS[name], entry['record'])
+                    else:
+                        changed = True
+                    self._cursors[name] = entry['seq']
+                if changed:
+                    self.publish('dataset-changed', {'dataset': name})
+
+    def on_write(self, name, added, old_signature, new_signature):
+        """DataStore listener: publish appended records, or a reload hint for rewrites"""
+        event = DATASET_EVENTS.get(name)
+        if event is None:
+            return
+        if self.changes is not None:
+            # The write is already in the change log, together with any
+            # other worker's writes we have not published yet
+            self.sync([name])
+            return
+        if added is None:
+            self.publish('dataset-changed', {'dataset': name})
+            return
+        for record in added:
+            self.publish(event, record)
@@ -0,0 +1,171 @@
+# exports.py
+
+import csv
+from datetime import datetime
+import io
+import json
+import os
+import random
+
+import xlsxwriter
+
+from indexes import parse_day
+
+# Datasets that can be exported, with the record field each date-range and
+# location filter applies to (None when the stage does not record one)
+EXPORT_DATASETS = {
+    'orderbook': {
+        'sheet': 'Orderbook', 'date_field': 'Office Date',
+        'date_formats': ('%d-%m-%Y', '%Y-%m-%d'), 'location_field': 'Weaving Location'
+    },
+    'warping_production': {
+        'sheet': 'Warping Production', 'date_field': 'start_datetime',
+        'date_formats': ('%Y-%m-%d',), 'location_field': None
+    },
+    'sizing_production': {
+        'sheet': 'Sizing Production', 'date_field': 'start_datetime',
+        'date_formats': ('%Y-%m-%d',), 'location_field': None
+    },
+    'beam_on_loom': {
+        'sheet': 'Beam On Loom', 'date_field': 'timestamp',
+        'date_formats': ('%Y-%m-%d',), 'location_field': 'location'
+    },
+    'grey_production': {
+        'sheet': 'Grey Production', 'date_field': 'date',
+        'date_formats': ('%Y-%m-%d',), 'location_field': None
+    },
+    'grey_dispatch': {
+        'sheet': 'Grey Dispatch', 'date_field': 'date',
+        'date_formats': ('%Y-%m-%d',), 'location_field': None
+    },
+    'unit259_production': {
+        'sheet': 'Unit 259 Production', 'date_field': 'date',
+        'date_formats': ('%Y-%m-%d',), 'location_field': 'location'
+    },
+}
+
+EXPORT_FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+# Rows sampled to estimate column widths, and the widest column allowed
+WIDTH_SAMPLE_SIZE = 500
+MAX_COLUMN_WIDTH = 50
+# Rows buffered per CSV chunk and bytes per chunk when streaming a file
+CSV_CHUNK_ROWS = 1000
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def parse_filter_date(value):
+    """Parse a YYYY-MM-DD filter argument; None when not given"""
+    if not value:
+        return None
+    return datetime.strptime(value, '%Y-%m-%d')
+
+
+def iter_export_records(records, spec, start=None, end=None, location=None):
+    """Yield the records inside the (inclusive) date range and location"""
+    date_field = spec['date_field']
+    location_field = spec['location_field']
+    for record in records:
+        if location is not None and str(record.get(location_field, '')).strip() != location:
+            continue
+        if start is not None or end is not None:
+            day = parse_day(record.get(date_field), spec['date_formats'])
+            if day is None or (start is not None and day < start) or (end is not None and day > end):
+                continue
+        yield record
+
+
+def scan_export(records, sample_size=WIDTH_SAMPLE_SIZE):
+    """One pass over the records: (columns in first-seen order, row sample, count).
+
+    The sample is a reservoir of at most sample_size records, so the pass
+    holds references to that many records whatever the dataset size.
+    """
+    columns = {}
+    sample = []
+    count = 0
+    rng = random.Random(0)
+    for record in records:
+        for key in record:
+            if key not in columns:
+                columns[key] = None
+        if count < sample_size:
+            sample.append(record)
+        else:
+            slot = rng.randint(0, count)
+            if slot < sample_size:
+                sample[slot] = record
+        count += 1
+    return list(columns), sample, count
+
+
+def cell_value(value):
+    """Value as written to a cell: scalars as-is, containers as JSON text"""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def column_widths(columns, sample):
+    """Estimate column widths from the header and a sample of rows"""
+    widths = []
+    for col in columns:
+        longest = max((len(str(cell_value(record.get(col)))) for record in sample), default=0)
+        widths.append(min(max(longest, len(col)) + 2, MAX_COLUMN_WIDTH))
+    return widths
+
+
+def write_xlsx(path, sheet_name, columns, records, widths):
+    """Write records to an XLSX file row by row in xlsxwriter's constant-memory mode"""
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'nan_inf_to_errors': True})
+    try:
+        worksheet = workbook.add_worksheet(sheet_name)
+        header_format = workbook.add_format({
+            'bold': True,
+            'text_wrap': True,
+            'valign': 'top',
+            'bg_color': '#D3D3D3'
+        })
+
+        # Column widths must be set before rows are flushed
+        for i, width in enumerate(widths):
+            worksheet.set_column(i, i, width)
+        worksheet.write_row(0, 0, columns, header_format)
+
+        for row, record in enumerate(records, start=1):
+            for col, key in enumerate(columns):
+                value = cell_value(record.get(key))
+                if value is not None:
+                    worksheet.write(row, col, value)
+    finally:
+        workbook.close()
+
+
+def iter_csv(columns, records, chunk_rows=CSV_CHUNK_ROWS):
+    """Yield CSV text in chunks of chunk_rows rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for i, record in enumerate(records, start=1):
+        writer.writerow(['' if record.get(key) is None else cell_value(record.get(key)) for key in columns])
+        if i % chunk_rows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_file_and_remove(path, chunk_size=FILE_CHUNK_SIZE):
+    """Yield a file's bytes in chunks and delete it once streamed"""
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+    finally:
+        os.remove(path)
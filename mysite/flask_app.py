@@ -12,8 +12,21 @@ from datetime import datetime, date, timedelta
 import traceback
 import logging
 import sys
+import tempfile
+import threading
 from forms import *
 from access import setup_access_management, init_access_routes, init_access_users, roles_required
+from datastore import DataStore
+from events import EventBus
+from exports import (EXPORT_DATASETS, EXPORT_FORMATS, column_widths, iter_csv, iter_export_records,
+                     iter_file_and_remove, parse_filter_date, scan_export, write_xlsx)
+from jobs import JobQueue
+from serialization import FastJSONProvider
+from coalescer import InsertRejected, WriteCoalescer
+from ingest import (GREY_REQUIRED_COLUMNS, format_date, missing_columns, read_orderbook_upload,
+                    validate_grey_upload)
+from indexes import (BeamStateIndex, LoomOccupancyIndex, ProductionIndex, ComboStageIndex, RecordGridIndex,
+                     OrderbookCatalog, WarpingLedger, RoleIndex, LOOM_RANGES)
 from flask_login import login_required, current_user
 from collections import defaultdict
 
@@ -32,6 +45,8 @@ logger.addHandler(handler)
 # App Configuration
 # =============================================================================
 app = Flask(__name__)
+if FastJSONProvider is not None:
+    app.json = FastJSONProvider(app)
 CORS(app)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
@@ -61,13 +76,64 @@ class DateEncoder(json.JSONEncoder):
 # =============================================================================
 # Data Management Functions
 # =============================================================================
-def read_df(filename):
-    filepath = os.path.join(DATA_DIR, f'{filename}.json')
-    return pd.read_json(filepath)
-
-def write_df(filename, data):
-    filepath = os.path.join(DATA_DIR, f'{filename}.json')
-    data.to_json(filepath,orient='records',indent=4)
+store = DataStore(DATA_DIR, encoder=DateEncoder, engine=os.getenv('STORAGE_ENGINE', 'json'),
+                  pretty=os.getenv('JSON_PRETTY') == '1',
+                  compress_partitions=os.getenv('PARTITION_COMPRESS') == '1')
+
+beam_states = BeamStateIndex(store)
+loom_occupancy = LoomOccupancyIndex(store)
+production_index = ProductionIndex(store)
+combo_stages = ComboStageIndex(store)
+orderbook_catalog = OrderbookCatalog(store)
+warping_ledger = WarpingLedger(store)
+user_roles = RoleIndex(store)
+
+# Server-side DataTables grids: the record field behind each table column
+# (None for computed/action columns) and the table's default order and page size
+RECORD_GRIDS = {
+    'warping_production': {
+        'columns': ['order_no', 'design_no', 'beam_no', 'machine_no', 'quantity',
+                    'warping_time_minutes', 'efficiency', None, None],
+        'order': [[0, 'desc']],
+        'page_length': 10
+    },
+    'sizing_production': {
+        'columns': ['beam_no', 'status', 'sizer_name', 'start_datetime', 'end_datetime',
+                    'rf', 'moisture', 'speed', 'comments'],
+        'order': [[3, 'desc']],
+        'page_length': 25
+    },
+    'unit259_production': {
+        'columns': ['date', 'shift', 'shift_time', 'loom_no', 'design_no', 'order_no',
+                    'production_meters', 'efficiency', 'loss_meters', 'weaver_name', 'comments'],
+        'order': [[0, 'desc'], [1, 'desc']],
+        'page_length': 25
+    },
+    'beam_on_loom': {
+        'columns': ['timestamp', 'beam_no', 'loom_no', 'status', 'role', 'name'],
+        'order': [[0, 'desc']],
+        'page_length': 10
+    },
+}
+record_grids = {name: RecordGridIndex(store, name, grid['columns']) for name, grid in RECORD_GRIDS.items()}
+
+# Live updates for the shop-floor pages, published from the write path
+event_bus = EventBus(store.changes)
+store.add_listener(event_bus.on_write)
+
+# Shop-floor inserts arriving within a few milliseconds share one write
+write_coalescer = WriteCoalescer(store, window=float(os.getenv('WRITE_COALESCE_MS', '5')) / 1000)
+
+# Excel uploads can run off the request thread; job records live in data/jobs/
+upload_jobs = JobQueue(os.path.join(DATA_DIR, 'jobs'), max_workers=int(os.getenv('UPLOAD_JOB_WORKERS', '2')))
+upload_jobs.register('orderbook', lambda path, filename, progress: process_orderbook_upload(path, filename, progress))
+upload_jobs.register('grey_production', lambda path, filename, progress: process_grey_upload('grey_production', path, progress))
+upload_jobs.register('grey_dispatch', lambda path, filename, progress: process_grey_upload('grey_dispatch', path, progress))
+
+JSON_DATASETS = ['orderbook', 'warping_production', 'warping_dispatch',
+                 'sizing_production', 'sizing_dispatch', 'beam_on_loom',
+                 'grey_production', 'unit259_production', 'user_management',
+                 'initiate_beam', 'grey_dispatch', 'orders_closed']
 
 def formulate_select_frm_df(data,col):
     """Get unique values from data and ensure consistent string format"""
@@ -87,19 +153,54 @@ def init_json_file(filename):
             json.dump([], f, cls=DateEncoder)
 
 def read_json_file(filename):
-    """Read data from JSON file"""
-    filepath = os.path.join(DATA_DIR, f'{filename}.json')
-    try:
-        with open(filepath, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return []
+    """Read data from JSON file (served from the shared dataset cache)"""
+    return store.read(filename)
 
 def write_json_file(filename, data):
     """Write data to JSON file"""
-    filepath = os.path.join(DATA_DIR, f'{filename}.json')
-    with open(filepath, 'w') as f:
-        json.dump(data, f, indent=4, cls=DateEncoder)
+    store.write(filename, data)
+
+def append_json_records(filename, records):
+    """Append new records to a dataset without rewriting existing ones"""
+    store.append(filename, records)
+
+def read_recent_records(filename, days, date_field='date'):
+    """Records dated within the last `days` days (only those months are read when partitioned)"""
+    today = datetime.now()
+    start = today - timedelta(days=days)
+    since, until = start.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+    # Every month from the window's start through today, however many it spans
+    return [dict(r) for r in store.read_range(filename, start, today)
+            if since <= str(r.get(date_field) or '')[:10] <= until]
+
+_dataset_bodies = {}  # dataset -> (version, serialized JSON body)
+
+def dataset_json_response(filename):
+    """JSON dump of a dataset with strong ETag, Last-Modified and X-Data-Version headers.
+
+    The ETag is built from the dataset's version token, so a request whose
+    If-None-Match still matches is answered 304 without reading or
+    serializing the dataset, and the serialized body is reused by every
+    client until the dataset changes.
+    """
+    version = store.version(filename)
+    if version is None:
+        return jsonify([])
+
+    etag = f'{filename}-{version}'
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        cached = _dataset_bodies.get(filename)
+        if cached is None or cached[0] != version:
+            cached = (version, f'{app.json.dumps(store.read_shared(filename))}\n')
+            _dataset_bodies[filename] = cached
+        response = app.response_class(cached[1], mimetype='application/json')
+
+    response.set_etag(etag)
+    response.last_modified = store.modified(filename)
+    response.headers['X-Data-Version'] = version
+    return response
 
 def load_json_data(file_path):
     """Load JSON data with error handling"""
@@ -169,8 +270,7 @@ def sort_records(records, reverse=True):
 def get_users_by_role(role):
     """Get list of users for a specific role"""
     try:
-        users = read_json_file('user_management')
-        return [user['name'] for user in users if role in user['roles']]
+        return user_roles.users(role)
     except Exception as e:
         logger.error(f'Error getting users by role: {str(e)}')
         return []
@@ -178,28 +278,22 @@ def get_users_by_role(role):
 def update_form_choices(form):
     """Update form choices based on user roles"""
     if hasattr(form, 'warper_name'):
-        warpers = get_users_by_role('Warper')
-        form.warper_name.choices = [('', 'Select Warper')] + [(name, name) for name in warpers]
+        form.warper_name.choices = [('', 'Select Warper')] + user_roles.choice_list('Warper')
 
     if hasattr(form, 'sizer_name'):
-        sizers = get_users_by_role('Sizer')
-        form.sizer_name.choices = [('', 'Select Sizer')] + [(name, name) for name in sizers]
+        form.sizer_name.choices = [('', 'Select Sizer')] + user_roles.choice_list('Sizer')
 
     if hasattr(form, 'weaver_name'):
-        weavers = get_users_by_role('Grey Weaver')
-        form.weaver_name.choices = [('', 'Select Weaver')] + [(name, name) for name in weavers]
+        form.weaver_name.choices = [('', 'Select Weaver')] + user_roles.choice_list('Grey Weaver')
 
     if hasattr(form, 'reliever_name'):
-        relievers = get_users_by_role('Grey Reliever')
-        form.reliever_name.choices = [('', 'Select Reliever')] + [(name, name) for name in relievers]
+        form.reliever_name.choices = [('', 'Select Reliever')] + user_roles.choice_list('Grey Reliever')
 
     if hasattr(form, 'foreman'):
-        foremen = get_users_by_role('Grey Foreman')
-        form.foreman.choices = [('', 'Select Foreman')] + [(name, name) for name in foremen]
+        form.foreman.choices = [('', 'Select Foreman')] + user_roles.choice_list('Grey Foreman')
 
     if hasattr(form, 'qc_checker'):
-        qc_checkers = get_users_by_role('Grey QC')
-        form.qc_checker.choices = [('', 'Select QC Checker')] + [(name, name) for name in qc_checkers]
+        form.qc_checker.choices = [('', 'Select QC Checker')] + user_roles.choice_list('Grey QC')
 
 # Add these new routes
 @app.route('/user-management', methods=['GET', 'POST', 'DELETE'])
@@ -212,9 +306,10 @@ def user_management():
 
         if request.method == 'DELETE':
             data = request.get_json()
-            users = read_json_file('user_management')
-            users = [user for user in users if user['name'] != data['name']]
-            write_json_file('user_management', users)
+            with store.lock('user_management'):
+                users = read_json_file('user_management')
+                users = [user for user in users if user['name'] != data['name']]
+                write_json_file('user_management', users)
             return jsonify({'success': True})
 
         if request.method == 'POST' and form.validate_on_submit():
@@ -224,18 +319,19 @@ def user_management():
                 'timestamp': datetime.now().isoformat()
             }
 
-            users = read_json_file('user_management')
-            existing_user_index = next((idx for idx, user in enumerate(users)
-                                     if user['name'] == data['name']), None)
+            with store.lock('user_management'):
+                users = read_json_file('user_management')
+                existing_user_index = next((idx for idx, user in enumerate(users)
+                                         if user['name'] == data['name']), None)
 
-            if existing_user_index is not None:
-                users[existing_user_index].update(data)
-                flash('User updated successfully', 'success')
-            else:
-                users.append(data)
-                flash('User added successfully', 'success')
+                if existing_user_index is not None:
+                    users[existing_user_index].update(data)
+                    flash('User updated successfully', 'success')
+                else:
+                    users.append(data)
+                    flash('User added successfully', 'success')
 
-            write_json_file('user_management', users)
+                write_json_file('user_management', users)
             return redirect(url_for('user_management'))
 
         users = read_json_file('user_management')
@@ -266,97 +362,33 @@ def user_management():
 # =============================================================================
 def get_unique_design_numbers():
     """Get unique design numbers from orderbook data"""
-    orderbook_data = read_json_file('orderbook')
-    design_numbers = []
-    for record in orderbook_data:
-        design_no = str(record.get('Design No.', '')).strip()
-        if design_no:
-            design_numbers.append(design_no)
-    return sorted(set(design_numbers), key=str)
+    return orderbook_catalog.design_numbers()
 
 def get_production_details(beam_no):
     """Get production details for a specific beam number"""
-    production_records = read_json_file('warping_production')
-    for record in production_records:
-        if record['beam_no'] == beam_no:
-            return {
-                'design_no': record['design_no'],
-                'quantity': record['quantity'],
-                'machine_no': record['machine_no'],
-                'warper_name': record['warper_name'],
-                'sections': record['sections'],
-                'breakages': record['breakages']
-            }
-    return None
+    return production_index.get(beam_no)
 
 def get_available_beams():
     """Get list of beam numbers from warping production that haven't been dispatched"""
-    production_records = read_json_file('warping_production')
-    dispatch_records = read_json_file('warping_dispatch')
-
-    dispatched_beams = {record['beam_no'] for record in dispatch_records
-                       if record['dispatch_status'] == 'Yes'}
-
-    available_beams = []
-    for record in production_records:
-        if record['beam_no'] not in dispatched_beams:
-            available_beams.append(record['beam_no'])
-
-    return sorted(set(available_beams))
+    return beam_states.available('warping_dispatch')
 
 def get_available_sized_beams():
     """Get list of beam numbers available for sizing"""
     try:
-        # Get all dispatched beams from warping
-        dispatch_records = read_json_file('warping_dispatch')
-        sizing_records = read_json_file('sizing_production')
-
-        # Create a set of beams that have already been sized
-        sized_beams = {record['beam_no'] for record in sizing_records}
-
-        # Get beams that have been dispatched from warping but not yet sized
-        available_beams = []
-        for record in dispatch_records:
-            if record['dispatch_status'] == 'Yes' and record['beam_no'] not in sized_beams:
-                available_beams.append(record['beam_no'])
-
-        return sorted(set(available_beams))
+        # Beams dispatched from warping but not yet sized
+        return beam_states.available('sizing_production')
     except Exception as e:
         logger.error(f'Error getting available sized beams: {str(e)}')
         return []
 
 def get_available_sized_beams_for_dispatch():
     """Get list of sized beams available for dispatch"""
-    sizing_records = read_json_file('sizing_production')
-    dispatch_records = read_json_file('sizing_dispatch')
-
-    dispatched_beams = {record['beam_no'] for record in dispatch_records
-                       if record['dispatch_status'] == 'Yes'}
-
-    available_beams = []
-    for record in sizing_records:
-        if record['status'] == 'Yes' and record['beam_no'] not in dispatched_beams:
-            available_beams.append(record['beam_no'])
-
-    return sorted(set(available_beams))
+    return beam_states.available('sizing_dispatch')
 
 def get_available_beams_for_loom():
     """Get list of beams available for putting on loom"""
     try:
-        dispatch_records = read_json_file('sizing_dispatch')
-        loom_records = read_json_file('beam_on_loom')
-
-        completed_beams = set()
-        for record in loom_records:
-            if record.get('process') == 'Beam End' and record.get('process_update') == 'End':
-                completed_beams.add(record['beam_no'])
-
-        available_beams = []
-        for record in dispatch_records:
-            if record.get('dispatch_status') == 'Yes' and record['beam_no'] not in completed_beams:
-                available_beams.append(record['beam_no'])
-
-        return sorted(set(available_beams))
+        return beam_states.available('beam_on_loom')
     except Exception as e:
         logger.error(f'Error getting available beams for loom: {str(e)}')
         return []
@@ -364,19 +396,7 @@ def get_available_beams_for_loom():
 def get_available_beams_for_grey_production():
     """Get list of beams available for grey production"""
     try:
-        beam_records = read_json_file('beam_on_loom')
-
-        completed_beams = set()
-        for record in beam_records:
-            if (record.get('process') == 'QC' and
-                record.get('process_update') == 'End'):
-                completed_beams.add(record['beam_no'])
-
-        grey_records = read_json_file('grey_production')
-        processed_beams = {record['beam_no'] for record in grey_records}
-
-        available_beams = completed_beams - processed_beams
-        return sorted(available_beams)
+        return beam_states.available('grey_production')
     except Exception as e:
         logger.error(f'Error getting available beams for grey production: {str(e)}')
         return []
@@ -394,16 +414,6 @@ def formulate_select(file,column):
     lst = sorted(set(lst), key=str)
     return lst
 
-def read_df(filename):
-    DATA_DIR = os.path.join(os.getcwd(),'data')
-    filepath = os.path.join(DATA_DIR, f'{filename}.json')
-    return pd.read_json(filepath)
-
-def write_df(filename, data):
-    DATA_DIR = os.path.join(os.getcwd(),'data')
-    filepath = os.path.join(DATA_DIR, f'{filename}.json')
-    data.to_json(filepath,orient='records',indent=4)
-
 
 # =============================================================================
 # Route Handlers
@@ -419,146 +429,156 @@ def index():
 def send_static(path):
     return send_from_directory('static', path)
 
-# Production routes
-@app.route('/grey-production', methods=['GET', 'POST'])
-@login_required
-@roles_required('admin', 'manager', 'production')
-def grey_production():
-    """Handle grey production data upload and display"""
-    try:
-        if request.method == 'POST':
-            if 'file' not in request.files:
-                return jsonify({'error': 'No file part'}), 400
-
-            file = request.files['file']
-            if file.filename == '':
-                return jsonify({'error': 'No selected file'}), 400
+def get_uploaded_excel():
+    """Return (file, None) for a valid Excel upload, or (None, error response)"""
+    if 'file' not in request.files:
+        return None, (jsonify({'error': 'No file part'}), 400)
+
+    file = request.files['file']
+    if file.filename == '':
+        return None, (jsonify({'error': 'No selected file'}), 400)
+
+    if not file.filename.endswith(('.xlsx', '.xls')):
+        return None, (jsonify({'error': 'Invalid file type. Only Excel files are allowed.'}), 400)
+    return file, None
+
+def wants_background_job():
+    """Uploads run as a background job when the client asks with async=1"""
+    return (request.args.get('async') or request.form.get('async')) in ('1', 'true')
+
+def submit_upload_job(kind, file):
+    """Queue an uploaded file for background processing and return the 202 response"""
+    job = upload_jobs.submit(kind, file, secure_filename(file.filename),
+                             user=getattr(current_user, 'username', None))
+    return jsonify({
+        'success': True,
+        'job_id': job['id'],
+        'status': job['status'],
+        'status_url': url_for('get_job', job_id=job['id'])
+    }), 202
+
+def process_grey_upload(dataset, file, progress=None):
+    """Validate a grey production/dispatch sheet and append it; returns (payload, status)"""
+    progress = progress or (lambda **fields: None)
+
+    # Read the Excel file
+    progress(stage='reading')
+    df = pd.read_excel(file)
+    progress(stage='validating', rows_read=len(df))
+
+    # Check for missing columns
+    missing = missing_columns(df.columns, GREY_REQUIRED_COLUMNS)
+    if missing:
+        return {'error': f'Missing required columns: {", ".join(missing)}'}, 400
+
+    # Validate all rows at once and check piece numbers against existing
+    # records; the lock keeps two uploads (from any worker) from passing the
+    # same duplicates check
+    with store.lock(dataset):
+        new_records, error_messages = validate_grey_upload(df, read_json_file(dataset))
+
+        if error_messages:
+            return {'error': 'Validation errors occurred', 'details': error_messages}, 400
+
+        if not new_records:
+            return {'error': 'No valid records to process'}, 400
+
+        # Save valid records
+        progress(stage='merging')
+        append_json_records(dataset, new_records)
+    progress(records_added=len(new_records))
 
-            if not file.filename.endswith(('.xlsx', '.xls')):
-                return jsonify({'error': 'Invalid file type. Only Excel files are allowed.'}), 400
-
-            # Read the Excel file
-            df = pd.read_excel(file)
-
-            required_columns = [
-                'Date', 'Piece No.', 'Loom No.', 'Design No.',
-                'Grey Production (Meters)', 'Grey Production (Weight)', 'Remarks'
-            ]
-
-            # Check for missing columns
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                return jsonify({
-                    'error': f'Missing required columns: {", ".join(missing_columns)}'
-                }), 400
-
-            # Read existing records
-            existing_records = read_json_file('grey_production')
-
-            # Create a set of existing piece numbers
-            existing_pieces = {str(record.get('piece_no')).strip().upper() for record in existing_records}
+    return {
+        'success': True,
+        'message': f'Successfully processed {len(new_records)} records'
+    }, 200
+
+def handle_grey_upload(dataset):
+    """Validate an uploaded grey production/dispatch sheet and append it to a dataset"""
+    file, error = get_uploaded_excel()
+    if error:
+        return error
+    if wants_background_job():
+        return submit_upload_job(dataset, file)
+
+    payload, status = process_grey_upload(dataset, file)
+    return jsonify(payload), status
+
+def grid_page(dataset, order, search='', start=0, length=10, draw=0):
+    """One page of a record grid in the DataTables server-side response format"""
+    order_by = [(column, direction == 'desc') for column, direction in order]
+    total, filtered, records = record_grids[dataset].page(order_by, search, start, length)
+    return {
+        'draw': draw,
+        'recordsTotal': total,
+        'recordsFiltered': filtered,
+        'data': records
+    }
 
-            # Process new records and check for duplicates
-            new_records = []
-            duplicate_pieces = []
-            validation_errors = []
+def initial_grid(dataset):
+    """Default order, page size and first page of a grid, embedded in its HTML page"""
+    grid = RECORD_GRIDS[dataset]
+    return {
+        'order': grid['order'],
+        'page_length': grid['page_length'],
+        'page': grid_page(dataset, grid['order'], length=grid['page_length'])
+    }
 
-            for index, row in df.iterrows():
-                try:
-                    # Basic data validation
-                    if pd.isna(row['Piece No.']):
-                        validation_errors.append(f"Row {index + 2}: Piece number cannot be empty")
-                        continue
-
-                    piece_no = str(row['Piece No.']).strip().upper()
-
-                    # Validate date
-                    if pd.isna(row['Date']):
-                        validation_errors.append(f"Row {index + 2}: Date is required for piece number {piece_no}")
-                        continue
-
-                    try:
-                        date_val = pd.to_datetime(row['Date'])
-                        if date_val > pd.Timestamp.now():
-                            validation_errors.append(f"Row {index + 2}: Date cannot be in the future for piece number {piece_no}")
-                            continue
-                    except Exception:
-                        validation_errors.append(f"Row {index + 2}: Invalid date format for piece number {piece_no}")
-                        continue
-
-                    # Validate numeric fields
-                    loom_no = row['Loom No.']
-                    if pd.isna(loom_no) or not str(loom_no).strip().isdigit():
-                        validation_errors.append(f"Row {index + 2}: Invalid loom number for piece number {piece_no}")
-                        continue
-
-                    prod_meters = row['Grey Production (Meters)']
-                    if pd.isna(prod_meters) or not isinstance(prod_meters, (int, float)) or prod_meters <= 0:
-                        validation_errors.append(f"Row {index + 2}: Invalid production meters for piece number {piece_no}")
-                        continue
-
-                    prod_weight = row['Grey Production (Weight)']
-                    if pd.isna(prod_weight) or not isinstance(prod_weight, (int, float)) or prod_weight <= 0:
-                        validation_errors.append(f"Row {index + 2}: Invalid production weight for piece number {piece_no}")
-                        continue
-
-                    # Check for duplicate piece numbers in existing records
-                    if piece_no in existing_pieces:
-                        duplicate_pieces.append(piece_no)
-                        continue
-
-                    # Check for duplicate piece numbers within new records
-                    if piece_no in {record['piece_no'] for record in new_records}:
-                        duplicate_pieces.append(piece_no)
-                        continue
-
-                    # Prepare record
-                    record = {
-                        'date': date_val.strftime('%Y-%m-%d'),
-                        'piece_no': piece_no,
-                        'loom_no': int(loom_no),
-                        'design_no': str(row['Design No.']).strip(),
-                        'production_meters': float(prod_meters),
-                        'production_weight': float(prod_weight),
-                        'remarks': str(row['Remarks']) if pd.notna(row['Remarks']) else '',
-                        'timestamp': datetime.now().isoformat()
-                    }
-
-                    new_records.append(record)
+def grid_response(dataset):
+    """Answer a DataTables server-side processing request (draw/start/length/search/order)"""
+    try:
+        draw = int(request.args.get('draw', 0))
+        start = max(int(request.args.get('start', 0)), 0)
+        length = int(request.args.get('length', RECORD_GRIDS[dataset]['page_length']))
+        order = []
+        i = 0
+        while f'order[{i}][column]' in request.args:
+            direction = 'desc' if request.args.get(f'order[{i}][dir]') == 'desc' else 'asc'
+            order.append((int(request.args[f'order[{i}][column]']), direction))
+            i += 1
+    except ValueError:
+        return jsonify({'error': 'Invalid grid request'}), 400
 
-                except Exception as e:
-                    validation_errors.append(f"Row {index + 2}: Error processing row: {str(e)}")
+    search = request.args.get('search[value]', '')
+    return jsonify(grid_page(dataset, order, search, start, length, draw))
 
-            # Compile all errors
-            error_messages = []
-            if validation_errors:
-                error_messages.extend(validation_errors)
-            if duplicate_pieces:
-                error_messages.append(f"Duplicate piece numbers found: {', '.join(duplicate_pieces)}")
+@app.route('/warping-production/grid')
+@login_required
+@roles_required('admin', 'manager', 'warping')
+def warping_production_grid():
+    return grid_response('warping_production')
 
-            if error_messages:
-                return jsonify({
-                    'error': 'Validation errors occurred',
-                    'details': error_messages
-                }), 400
+@app.route('/sizing-production/grid')
+@login_required
+@roles_required('admin', 'manager', 'sizing')
+def sizing_production_grid():
+    return grid_response('sizing_production')
 
-            if not new_records:
-                return jsonify({
-                    'error': 'No valid records to process'
-                }), 400
+@app.route('/unit259-production/grid')
+@login_required
+@roles_required('admin', 'manager', 'production')
+def unit259_production_grid():
+    return grid_response('unit259_production')
 
-            # Save valid records
-            existing_records.extend(new_records)
-            existing_records.sort(key=lambda x: x.get('date', ''), reverse=True)
-            write_json_file('grey_production', existing_records)
+@app.route('/beam-on-loom/grid')
+@login_required
+@roles_required('admin', 'manager', 'production')
+def beam_on_loom_grid():
+    return grid_response('beam_on_loom')
 
-            return jsonify({
-                'success': True,
-                'message': f'Successfully processed {len(new_records)} records'
-            })
+# Production routes
+@app.route('/grey-production', methods=['GET', 'POST'])
+@login_required
+@roles_required('admin', 'manager', 'production')
+def grey_production():
+    """Handle grey production data upload and display"""
+    try:
+        if request.method == 'POST':
+            return handle_grey_upload('grey_production')
 
-        # GET request handling
-        records = read_json_file('grey_production')
+        # GET request handling; ?days=N shows only the last N days
+        days = request.args.get('days', type=int)
+        records = read_recent_records('grey_production', days) if days else read_json_file('grey_production')
         records.sort(key=lambda x: x.get('date', ''), reverse=True)
         return render_template('grey_production.html', records=records)
 
@@ -569,16 +589,6 @@ def grey_production():
             'error': f'Error processing file: {str(e)}'
         }), 500
 
-def format_date(date_value):
-    if pd.isna(date_value):
-        return None
-    try:
-        if isinstance(date_value, str):
-            date_value = pd.to_datetime(date_value)
-        return date_value.strftime('%Y-%m-%d')
-    except:
-        return None
-
 def get_latest_loom_design(loom_no, location='259/1'):
     """Get latest design info for a loom with location consideration"""
     try:
@@ -588,7 +598,6 @@ def get_latest_loom_design(loom_no, location='259/1'):
         # Get required data
         beam_records = read_json_file('beam_on_loom')
         initiate_records = read_json_file('initiate_beam')
-        orderbook_records = read_json_file('orderbook')
 
         # First check initiate_beam records for this location
         sorted_initiate_records = sorted(
@@ -641,13 +650,9 @@ def get_latest_loom_design(loom_no, location='259/1'):
 
         # Get order details from orderbook
         # Make sure to match both design number and location
-        order_details = None
-        for record in orderbook_records:
-            if (str(record.get('Design No.', '')).strip() == str(design_no).strip() and
-                str(record.get('Weaving Location', '')).strip() == location.strip()):
-                order_details = record
-                logger.debug(f"Found order details for design: {design_no} at location: {location}")
-                break
+        order_details = orderbook_catalog.design_at_location(design_no, location)
+        if order_details:
+            logger.debug(f"Found order details for design: {design_no} at location: {location}")
 
         if not order_details:
             logger.debug(f"No order details found for design {design_no} at location {location}")
@@ -696,6 +701,53 @@ def get_loom_latest(loom_no):
             'error': 'Internal server error'
         }), 500
 
+@app.cli.command('migrate-sqlite')
+def migrate_sqlite():
+    """Import the JSON files in DATA_DIR into the SQLite store"""
+    source_engine = os.getenv('MIGRATE_FROM_ENGINE', 'json')
+    target = DataStore(DATA_DIR, encoder=DateEncoder, engine='sqlite')
+    counts = target.migrate(JSON_DATASETS, source_engine=source_engine)
+    for name, count in counts.items():
+        print(f'{name}: {count} records')
+    print(f'Migrated {len(counts)} datasets into {target.path("orderbook")}. '
+          f'Set STORAGE_ENGINE=sqlite to use it.')
+
+@app.route('/api/cache-stats')
+@login_required
+@roles_required('admin')
+def get_cache_stats():
+    """API endpoint to get dataset cache hit/miss counters"""
+    return jsonify(store.stats())
+
+@app.route('/api/events')
+@login_required
+def stream_events():
+    """Server-Sent Events stream of new loom transitions and production records.
+
+    ?events=loom-status,initiate-beam,... limits the stream to those event
+    types; a reconnecting EventSource sends Last-Event-ID and is replayed
+    what it missed. Each stream holds a worker thread, so it is closed after
+    STREAM_MAX_AGE seconds and the browser reconnects. Event ids are per
+    worker: a reconnect served by another worker gets a reset event.
+    """
+    events = request.args.get('events')
+    events = set(events.split(',')) if events else None
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return app.response_class(
+        event_bus.stream(events, last_event_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/jobs/<job_id>')
+@login_required
+def get_job(job_id):
+    """API endpoint to poll a background upload job"""
+    job = upload_jobs.get(job_id)
+    if job is None or (job.get('user') != current_user.username and 'admin' not in current_user.roles):
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 # Error handlers
 @app.errorhandler(413)
 def too_large(e):
@@ -714,14 +766,8 @@ if __name__ == '__main__':
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
 
-    # Initialize JSON files
-    json_files = ['orderbook', 'warping_production', 'warping_dispatch',
-                  'sizing_production', 'sizing_dispatch', 'beam_on_loom',
-                  'grey_production', 'unit259_production', 'user_management',
-                  'initiate_beam', 'grey_dispatch']
-
     # Initialize all JSON files
-    for file in json_files:
+    for file in JSON_DATASETS:
         init_json_file(file)
 
     # Start the application
@@ -738,29 +784,9 @@ def unit259_production():
         form = Unit259ProductionForm()
         update_form_choices(form)
 
-        # Get available looms
+        # Get available looms (latest status QC End at 259/1)
         try:
-            beam_records = read_json_file('beam_on_loom')
-            available_looms = set()
-
-            # Track latest status for each loom
-            loom_status = {}
-            for record in beam_records:
-                loom_no = record.get('loom_no')
-                timestamp = record.get('timestamp')
-                if loom_no and timestamp:
-                    if loom_no not in loom_status or timestamp > loom_status[loom_no]['timestamp']:
-                        loom_status[loom_no] = {
-                            'status': record.get('status'),
-                            'timestamp': timestamp,
-                            'location': record.get('location')
-                        }
-
-            # Add looms with QC End status and correct location
-            for loom_no, status in loom_status.items():
-                if status['status'] == 'QC End' and status.get('location') == '259/1':
-                    available_looms.add(str(loom_no))
-
+            available_looms = {str(loom_no) for loom_no in loom_occupancy.qc_done_looms('259/1')}
             form.loom_no.choices = [('', 'Select Loom No.')] + [(loom, loom) for loom in sorted(available_looms)]
         except Exception as e:
             logger.error(f"Error getting available looms: {str(e)}")
@@ -812,15 +838,8 @@ def unit259_production():
                     'timestamp': datetime.now().isoformat()
                 }
 
-                # Read existing records and append new one
-                records = read_json_file('unit259_production')
-                records.append(data)
-
-                # Sort by date and shift
-                records.sort(key=lambda x: (x['date'], x['shift']), reverse=True)
-
-                # Write back to file
-                write_json_file('unit259_production', records)
+                # Append new record, batched with concurrent submits
+                write_coalescer.insert('unit259_production', [data])
 
                 return jsonify({
                     'success': True,
@@ -834,11 +853,7 @@ def unit259_production():
                     'error': str(e)
                 }), 500
 
-        # Get records for display
-        records = read_json_file('unit259_production')
-        records.sort(key=lambda x: (x['date'], x['shift']), reverse=True)
-
-        return render_template('unit259_production.html', form=form, records=records)
+        return render_template('unit259_production.html', form=form, grid=initial_grid('unit259_production'))
 
     except Exception as e:
         logger.error(f'Unexpected error in unit259_production: {str(e)}')
@@ -854,28 +869,8 @@ def get_unit259_looms(exclude_maintenance=True):
         if not exclude_maintenance:
             return sorted(all_looms)
 
-        # Get looms under maintenance from unit259_production records
-        production_records = read_json_file('unit259_production')
-
-        # Track looms currently under maintenance
-        maintenance_looms = set()
-
-        # Get the latest status for each loom
-        loom_latest_status = {}
-        for record in production_records:
-            loom_no = record.get('loom_no')
-            timestamp = record.get('timestamp')
-            if loom_no and timestamp:
-                if loom_no not in loom_latest_status or timestamp > loom_latest_status[loom_no]['timestamp']:
-                    loom_latest_status[loom_no] = {
-                        'status': record.get('status'),
-                        'timestamp': timestamp
-                    }
-
-        # Add looms with latest status as 'u/Maintenance' to maintenance set
-        for loom_no, status_info in loom_latest_status.items():
-            if status_info['status'] == 'u/Maintenance':
-                maintenance_looms.add(loom_no)
+        # Looms whose latest unit259_production status is under maintenance
+        maintenance_looms = set(loom_occupancy.maintenance_looms())
 
         # Remove maintenance looms from available looms
         available_looms = [loom for loom in all_looms if loom not in maintenance_looms]
@@ -893,138 +888,11 @@ def grey_dispatch():
     """Handle grey dispatch data upload and display"""
     try:
         if request.method == 'POST':
-            if 'file' not in request.files:
-                return jsonify({'error': 'No file part'}), 400
-
-            file = request.files['file']
-            if file.filename == '':
-                return jsonify({'error': 'No selected file'}), 400
-
-            if not file.filename.endswith(('.xlsx', '.xls')):
-                return jsonify({'error': 'Invalid file type. Only Excel files are allowed.'}), 400
-
-            # Read the Excel file
-            df = pd.read_excel(file)
-
-            required_columns = [
-                'Date', 'Piece No.', 'Loom No.', 'Design No.',
-                'Grey Production (Meters)', 'Grey Production (Weight)', 'Remarks'
-            ]
-
-            # Check for missing columns
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                return jsonify({
-                    'error': f'Missing required columns: {", ".join(missing_columns)}'
-                }), 400
-
-            # Read existing records
-            existing_records = read_json_file('grey_dispatch')
-
-            # Create a set of existing piece numbers
-            existing_pieces = {str(record.get('piece_no')).strip().upper() for record in existing_records}
-
-            # Process new records and check for duplicates
-            new_records = []
-            duplicate_pieces = []
-            validation_errors = []
-
-            for index, row in df.iterrows():
-                try:
-                    # Basic data validation
-                    if pd.isna(row['Piece No.']):
-                        validation_errors.append(f"Row {index + 2}: Piece number cannot be empty")
-                        continue
-
-                    piece_no = str(row['Piece No.']).strip().upper()
-
-                    # Validate date
-                    if pd.isna(row['Date']):
-                        validation_errors.append(f"Row {index + 2}: Date is required for piece number {piece_no}")
-                        continue
-
-                    try:
-                        date_val = pd.to_datetime(row['Date'])
-                        if date_val > pd.Timestamp.now():
-                            validation_errors.append(f"Row {index + 2}: Date cannot be in the future for piece number {piece_no}")
-                            continue
-                    except Exception:
-                        validation_errors.append(f"Row {index + 2}: Invalid date format for piece number {piece_no}")
-                        continue
-
-                    # Validate numeric fields
-                    loom_no = row['Loom No.']
-                    if pd.isna(loom_no) or not str(loom_no).strip().isdigit():
-                        validation_errors.append(f"Row {index + 2}: Invalid loom number for piece number {piece_no}")
-                        continue
-
-                    prod_meters = row['Grey Production (Meters)']
-                    if pd.isna(prod_meters) or not isinstance(prod_meters, (int, float)) or prod_meters <= 0:
-                        validation_errors.append(f"Row {index + 2}: Invalid production meters for piece number {piece_no}")
-                        continue
-
-                    prod_weight = row['Grey Production (Weight)']
-                    if pd.isna(prod_weight) or not isinstance(prod_weight, (int, float)) or prod_weight <= 0:
-                        validation_errors.append(f"Row {index + 2}: Invalid production weight for piece number {piece_no}")
-                        continue
-
-                    # Check for duplicate piece numbers
-                    if piece_no in existing_pieces:
-                        duplicate_pieces.append(piece_no)
-                        continue
-
-                    # Check for duplicate piece numbers within new records
-                    if piece_no in {record['piece_no'] for record in new_records}:
-                        duplicate_pieces.append(piece_no)
-                        continue
-
-                    # Prepare record
-                    record = {
-                        'date': date_val.strftime('%Y-%m-%d'),
-                        'piece_no': piece_no,
-                        'loom_no': int(loom_no),
-                        'design_no': str(row['Design No.']).strip(),
-                        'production_meters': float(prod_meters),
-                        'production_weight': float(prod_weight),
-                        'remarks': str(row['Remarks']) if pd.notna(row['Remarks']) else '',
-                        'timestamp': datetime.now().isoformat()
-                    }
-
-                    new_records.append(record)
-
-                except Exception as e:
-                    validation_errors.append(f"Row {index + 2}: Error processing row: {str(e)}")
-
-            # Compile all errors
-            error_messages = []
-            if validation_errors:
-                error_messages.extend(validation_errors)
-            if duplicate_pieces:
-                error_messages.append(f"Duplicate piece numbers found: {', '.join(duplicate_pieces)}")
+            return handle_grey_upload('grey_dispatch')
 
-            if error_messages:
-                return jsonify({
-                    'error': 'Validation errors occurred',
-                    'details': error_messages
-                }), 400
-
-            if not new_records:
-                return jsonify({
-                    'error': 'No valid records to process'
-                }), 400
-
-            # Save valid records
-            existing_records.extend(new_records)
-            existing_records.sort(key=lambda x: x.get('date', ''), reverse=True)
-            write_json_file('grey_dispatch', existing_records)
-
-            return jsonify({
-                'success': True,
-                'message': f'Successfully processed {len(new_records)} records'
-            })
-
-        # GET request handling
-        records = read_json_file('grey_dispatch')
+        # GET request handling; ?days=N shows only the last N days
+        days = request.args.get('days', type=int)
+        records = read_recent_records('grey_dispatch', days) if days else read_json_file('grey_dispatch')
         records.sort(key=lambda x: x.get('date', ''), reverse=True)
         return render_template('grey_dispatch.html', records=records)
 
@@ -1035,50 +903,12 @@ def grey_dispatch():
             'error': f'Error processing file: {str(e)}'
         }), 500
 
-# @app.route('/grey-dispatch/export', methods=['GET'])
-# @login_required
-# @roles_required('admin', 'manager', 'production')
-# def export_grey_dispatch():
-#     """Export grey dispatch data to Excel"""
-#     try:
-#         records = read_json_file('grey_dispatch')
-#         df = pd.DataFrame(records)
-
-#         output = io.BytesIO()
-#         with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-#             df.to_excel(writer, index=False, sheet_name='Grey Dispatch')
-#             workbook = writer.book
-#             worksheet = writer.sheets['Grey Dispatch']
-
-#             # Add header formatting
-#             header_format = workbook.add_format({
-#                 'bold': True,
-#                 'text_wrap': True,
-#                 'valign': 'top',
-#                 'bg_color': '#D3D3D3'
-#             })
-
-#             for col_num, value in enumerate(df.columns.values):
-#                 worksheet.write(0, col_num, value, header_format)
-
-#             # Auto-adjust column widths
-#             for i, col in enumerate(df.columns):
-#                 max_length = max(df[col].astype(str).apply(len).max(), len(col))
-#                 worksheet.set_column(i, i, min(max_length + 2, 50))
-
-#         output.seek(0)
-#         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-#         return send_file(
-#             output,
-#             mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-#             as_attachment=True,
-#             download_name=f'grey_dispatch_export_{timestamp}.xlsx'
-#         )
-
-#     except Exception as e:
-#         logger.error(f'Error exporting grey dispatch data: {str(e)}')
-#         flash('Error exporting grey dispatch data', 'error')
-#         return redirect(url_for('grey_dispatch'))
+@app.route('/grey-dispatch/export', methods=['GET'])
+@login_required
+@roles_required('admin', 'manager', 'production')
+def export_grey_dispatch():
+    """Export grey dispatch data to Excel"""
+    return export_dataset_response('grey_dispatch')
 
 def check_data_directory():
     """Verify DATA_DIR exists and is accessible"""
@@ -1123,9 +953,7 @@ def check_data_directory():
         return False
 
 def get_warper_choices():
-    users = read_json_file('user_management')
-    warpers = [(user['name'], user['name']) for user in users if 'Warper' in user['roles']]
-    return [('', 'Select Warper Name')] + sorted(warpers)
+    return [('', 'Select Warper Name')] + user_roles.choice_list('Warper')
 
 @app.route('/warping-production', methods=['GET', 'POST'])
 @login_required
@@ -1143,65 +971,16 @@ def warping_production():
                 logger.debug(f"Created empty file: {filepath}")
 
     form = WarpingProductionForm()
-    orderbook_data = read_json_file('orderbook')
-    warping_records = read_json_file('warping_production')
 
     try:
-        # Update form choices
-        order_choices = set()
-        design_by_order = {}
-        order_groups = {}
-
-        # Group orders
-        for record in orderbook_data:
-            order_no = str(record.get('Order No.', ''))
-            if order_no not in order_groups:
-                order_groups[order_no] = []
-            order_groups[order_no].append(record)
-
-        # Process groups
-        for order_no, records in order_groups.items():
-            if order_no:
-                order_choices.add(order_no)
-                design_by_order[order_no] = {}
-                design_groups = {}
-
-                for record in records:
-                    design_no = str(record.get('Design No.', ''))
-                    quantity = float(record.get('Factory Order (Meters)', 0))
-
-                    if design_no not in design_groups:
-                        design_groups[design_no] = {
-                            'design_no': design_no,
-                            'total_quantity': 0,
-                            'orders': []
-                        }
-                    design_groups[design_no]['total_quantity'] += quantity
-                    design_groups[design_no]['orders'].append({
-                        'quantity': quantity,
-                        'order_details': record
-                    })
-
-                for design_no, info in design_groups.items():
-                    design_key = f"{design_no} (Total: {info['total_quantity']}m)"
-                    design_by_order[order_no][design_key] = {
-                        'design_no': design_no,
-                        'quantity': info['total_quantity'],
-                        'individual_orders': info['orders']
-                    }
-
         # Update form choices
         form.warper_name.choices = get_warper_choices()
-        form.order_no.choices = [('', 'Select Order No.')] + [(no, no) for no in sorted(order_choices)]
+        form.order_no.choices = [('', 'Select Order No.')] + [(no, no) for no in orderbook_catalog.order_numbers()]
+        design_choices = orderbook_catalog.design_choices(request.form.get('order_no'))
 
         if request.method == 'POST':
-            selected_order = request.form.get('order_no')
-            if selected_order in design_by_order:
-                design_choices = [('', 'Select Design No.')] + [
-                    (design_info['design_no'], design_key)
-                    for design_key, design_info in sorted(design_by_order[selected_order].items())
-                ]
-                form.design_no.choices = design_choices
+            if design_choices is not None:
+                form.design_no.choices = [('', 'Select Design No.')] + design_choices
 
             if not form.validate_on_submit():
                 logger.error(f"Form validation errors: {form.errors}")
@@ -1210,79 +989,57 @@ def warping_production():
                     'errors': form.errors
                 }), 400
 
-            # Check duplicate beam number
-            if any(r['beam_no'] == form.beam_no.data for r in warping_records):
-                return jsonify({
-                    'success': False,
-                    'error': f'Beam number {form.beam_no.data} already exists'
-                }), 400
-
-            existing_warping_qty = 0
-
-            # Validate quantities
-            if len(warping_records) > 0:
-                for r in warping_records:
-                    if r['order_no'] == form.order_no.data and r['design_no'] == form.design_no.data:
-                        existing_warping_qty += float(r['quantity'])
-
-            total_factory_qty = sum(
-                float(record.get('Factory Order (Meters)', 0))
-                for record in orderbook_data
-                if str(record.get('Order No.')) == form.order_no.data
-                and str(record.get('Design No.')) == form.design_no.data
-            )
-
-            new_qty = float(form.quantity.data)
-            if (existing_warping_qty + new_qty) > total_factory_qty:
-                return jsonify({
-                    'success': False,
-                    'error': 'Total warping quantity exceeds factory order quantity'
-                }), 400
-
             # Calculate metrics
+            new_qty = float(form.quantity.data)
             start_time = form.start_datetime.data
             end_time = form.end_datetime.data
             session_time = (end_time - start_time).total_seconds() / 60
             warping_time = ((new_qty / form.rpm.data) * form.sections.data) + (form.breakages.data * 5)
             efficiency = ((warping_time + 30) / session_time) * 100
 
-            # Get design info
-            selected_design = form.design_no.data
-            selected_order = form.order_no.data
-            design_info = next(
-                (info for key, info in design_by_order[selected_order].items()
-                 if info['design_no'] == selected_design),
-                None
-            )
+            # Validate and save under the dataset lock, so concurrent submits
+            # see each other's beams and quantities
+            with store.lock('warping_production'):
+                # Check duplicate beam number
+                if warping_ledger.has_beam(form.beam_no.data):
+                    return jsonify({
+                        'success': False,
+                        'error': f'Beam number {form.beam_no.data} already exists'
+                    }), 400
 
-            total_quantity = design_info['quantity'] if design_info else 0
+                # Validate quantities
+                existing_warping_qty = warping_ledger.warped_meters(form.order_no.data, form.design_no.data)
+                total_factory_qty = orderbook_catalog.factory_meters(form.order_no.data, form.design_no.data)
+                if (existing_warping_qty + new_qty) > total_factory_qty:
+                    return jsonify({
+                        'success': False,
+                        'error': 'Total warping quantity exceeds factory order quantity'
+                    }), 400
 
-            # Prepare record data
-            data = {
-                'order_no': form.order_no.data,
-                'design_no': form.design_no.data,
-                'total_order_quantity': total_quantity,
-                'machine_no': form.machine_no.data,
-                'beam_no': form.beam_no.data,
-                'quantity': new_qty,
-                'warper_name': form.warper_name.data,
-                'start_datetime_display': start_time.strftime('%d-%m-%Y %I:%M %p'),
-                'end_datetime_display': end_time.strftime('%d-%m-%Y %I:%M %p'),
-                'start_datetime': start_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'end_datetime': end_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'rpm': form.rpm.data,
-                'sections': form.sections.data,
-                'breakages': form.breakages.data,
-                'comments': form.comments.data,
-                'warping_time_minutes': warping_time,
-                'efficiency': round(efficiency, 2),
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
+                # Prepare record data
+                data = {
+                    'order_no': form.order_no.data,
+                    'design_no': form.design_no.data,
+                    'total_order_quantity': total_factory_qty,
+                    'machine_no': form.machine_no.data,
+                    'beam_no': form.beam_no.data,
+                    'quantity': new_qty,
+                    'warper_name': form.warper_name.data,
+                    'start_datetime_display': start_time.strftime('%d-%m-%Y %I:%M %p'),
+                    'end_datetime_display': end_time.strftime('%d-%m-%Y %I:%M %p'),
+                    'start_datetime': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'end_datetime': end_time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'rpm': form.rpm.data,
+                    'sections': form.sections.data,
+                    'breakages': form.breakages.data,
+                    'comments': form.comments.data,
+                    'warping_time_minutes': warping_time,
+                    'efficiency': round(efficiency, 2),
+                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                }
 
-            # Save record
-            print(data)
-            warping_records.append(data)
-            write_json_file('warping_production', warping_records)
+                # Save record
+                append_json_records('warping_production', [data])
 
             return jsonify({
                 'success': True,
@@ -1290,24 +1047,13 @@ def warping_production():
             })
 
         else:
-            selected_order = request.form.get('order_no')
-            if selected_order in design_by_order:
-                design_choices = [('', 'Select Design No.')] + [
-                    (design_info['design_no'], design_key)
-                    for design_key, design_info in sorted(design_by_order[selected_order].items())
-                ]
-                form.design_no.choices = design_choices
-            else:
-                form.design_no.choices = [('', 'Select Design No.')]
-
-        # Sort records for display
-        warping_records.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
+            form.design_no.choices = [('', 'Select Design No.')] + (design_choices or [])
 
         return render_template(
             'warping_production.html',
             form=form,
-            records=warping_records,
-            design_by_order=json.dumps(design_by_order)
+            grid=initial_grid('warping_production'),
+            design_by_order=orderbook_catalog.design_by_order_json()
         )
 
     except Exception as e:
@@ -1611,20 +1357,8 @@ def warping_production():
 def get_designs_by_order(order_no):
     """API endpoint to get designs for an order number"""
     try:
-        orderbook_data = read_json_file('orderbook')
         logger.debug(f"Fetching designs for order: {order_no}")
-
-        # Get unique designs for the order
-        available_designs = set()
-
-        for record in orderbook_data:
-            if str(record.get('Order No.')) == str(order_no):  # Convert both to string for comparison
-                design_no = record.get('Design No.')
-                if design_no:
-                    available_designs.add(str(design_no))  # Convert to string
-
-        # Convert to list and sort for consistent ordering
-        designs_list = sorted(list(available_designs))
+        designs_list = orderbook_catalog.designs(order_no)
         logger.debug(f"Found designs for order {order_no}: {designs_list}")
 
         response_data = {
@@ -1642,6 +1376,24 @@ def get_designs_by_order(order_no):
         }), 500
 
 
+@app.route('/api/beam-state/<beam_no>', methods=['GET'])
+def get_beam_state(beam_no):
+    """API endpoint to get the current pipeline stage of a beam"""
+    try:
+        state = beam_states.state(beam_no)
+        if state:
+            return jsonify({'success': True, **state})
+        return jsonify({
+            'success': False,
+            'error': 'Beam not found'
+        }), 404
+    except Exception as e:
+        logger.error(f'Error fetching beam state: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': 'Internal server error'
+        }), 500
+
 @app.route('/api/beam/<beam_no>', methods=['GET'])
 def get_beam_details(beam_no):
     """API endpoint to get beam details"""
@@ -1668,54 +1420,206 @@ def get_beam_details(beam_no):
 def get_json_data(filename):
     """API endpoint to fetch JSON data"""
     try:
-        if not filename.endswith('.json'):
-            filename = f"{filename}.json"
+        if filename.endswith('.json'):
+            filename = filename[:-len('.json')]
 
-        filepath = os.path.join(DATA_DIR, filename)
-        if not os.path.exists(filepath):
+        if os.path.basename(filename) != filename or store.signature(filename) is None:
             return jsonify({
                 'error': 'File not found',
-                'available_files': [f for f in os.listdir(DATA_DIR) if f.endswith('.json')]
+                'available_files': [f for f in os.listdir(DATA_DIR) if f.endswith(('.json', '.jsonl'))]
             }), 404
 
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-        return jsonify(data)
+        return dataset_json_response(filename)
 
     except Exception as e:
         logger.error(f'Error accessing JSON data: {str(e)}')
         return jsonify({'error': str(e)}), 500
 
+# Datasets whose changes can be followed through /api/changes/<dataset>,
+# with the roles of the page each one belongs to
+CHANGE_DATASETS = {
+    'orderbook': ('admin', 'manager'),
+    'orders_closed': ('admin', 'manager'),
+    'warping_production': ('admin', 'manager', 'warping'),
+    'warping_dispatch': ('admin', 'manager', 'warping'),
+    'sizing_production': ('admin', 'manager', 'sizing'),
+    'sizing_dispatch': ('admin', 'manager', 'sizing'),
+    'initiate_beam': ('admin', 'manager', 'production'),
+    'beam_on_loom': ('admin', 'manager', 'production'),
+    'unit259_production': ('admin', 'manager', 'production'),
+    'grey_production': ('admin', 'manager', 'production'),
+    'grey_dispatch': ('admin', 'manager', 'production'),
+}
+CHANGES_PAGE_LIMIT = 5000
+
+@app.route('/api/changes/<dataset>', methods=['GET'])
+@login_required
+def get_changes(dataset):
+    """API endpoint to get the records changed in a dataset since a cursor.
+
+    With since=<cursor> the response lists the insert/update/delete entries
+    after it and the new cursor (has_more is set when limit cut the list
+    short). Without a cursor, or with one the change log can no longer
+    serve, it is a snapshot: every record with its id, and reset=true.
+    """
+    if dataset not in CHANGE_DATASETS:
+        return jsonify({'error': f'Unknown dataset: {dataset}'}), 404
+    if not set(CHANGE_DATASETS[dataset]) & set(current_user.roles):
+        return jsonify({'error': 'Access denied: insufficient permissions'}), 403
+    try:
+        since = request.args.get('since')
+        since = int(since) if since is not None else None
+        limit = min(int(request.args.get('limit', CHANGES_PAGE_LIMIT)), CHANGES_PAGE_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'since and limit must be integers'}), 400
+    if since is not None and since < 0:
+        return jsonify({'error': 'since must not be negative'}), 400
+    if limit < 1:
+        return jsonify({'error': 'limit must be at least 1'}), 400
+
+    try:
+        changes = store.changes.since(dataset, since, limit + 1) if since is not None else None
+        if changes is None:
+            cursor, records = store.snapshot(dataset)
+            ids = store.changes.snapshot_ids(records)
+            return jsonify({
+                'dataset': dataset,
+                'cursor': cursor,
+                'reset': True,
+                'records': [{'id': record_id, 'record': record} for record_id, record in zip(ids, records)]
+            })
+
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        return jsonify({
+            'dataset': dataset,
+            'cursor': changes[-1]['seq'] if changes else since,
+            'reset': False,
+            'has_more': has_more,
+            'changes': changes
+        })
+
+    except Exception as e:
+        logger.error(f'Error getting changes for {dataset}: {str(e)}')
+        return jsonify({'error': str(e)}), 500
+
 # =============================================================================
 # Orderbook Routes
 # =============================================================================
+def close_order_numbers(order_nos, closed_by=None):
+    """Move the orderbook rows of the given orders into the orders_closed archive.
+
+    The rows are appended to the archive (an append-only log) and then
+    dropped from the live orderbook in one write, however many orders are
+    closed. Returns (closed order numbers, order numbers not in the orderbook).
+    """
+    closing = {str(order_no).strip() for order_no in order_nos if str(order_no).strip()}
+    with store.lock('orderbook'), store.lock('orders_closed'):
+        orderbook = store.read_shared('orderbook')
+        closed_rows = [r for r in orderbook if str(r.get('Order No.', '')).strip() in closing]
+        closed = sorted({str(r.get('Order No.', '')).strip() for r in closed_rows})
+        if closed_rows:
+            closed_at = datetime.now().isoformat()
+            # Archive first: an interrupted close leaves a duplicate, never a lost order
+            append_json_records('orders_closed', [
+                dict(r, closed_at=closed_at, closed_by=closed_by) for r in closed_rows
+            ])
+            write_json_file('orderbook', [
+                r for r in orderbook if str(r.get('Order No.', '')).strip() not in closing
+            ])
+    if closed:
+        logger.info(f"Closed {len(closed)} orders ({len(closed_rows)} orderbook rows): {', '.join(closed)}")
+    return closed, sorted(closing - set(closed))
+
 @app.route('/close-orders', methods=['GET', 'POST'])
 @login_required
 @roles_required('admin', 'manager')
 def close_orders():
     form = close_order()
-    form.order_no.choices = formulate_select('orderbook','Order No.')
-    records = []
+    form.order_no.choices = orderbook_catalog.order_numbers()
     if request.method == 'POST' and form.validate_on_submit():
-        data = {'Order No.':form.order_no.data,'Del':'Yes'}
-        records = read_json_file('orders_closed')
-        records.append(data)
-        df = pd.DataFrame(records)
-        df.drop_duplicates(inplace=True)
-        orders = read_df('orderbook')
-        orders['Order No.'] = orders['Order No.'].astype(int)
-        df['Order No.'] = df['Order No.'].astype(int)
-        df = df[['Order No.','Del']]
-        df.drop_duplicates(inplace=True)
-        output_df = orders.merge(df,on=['Order No.'],how='left')
-        tally_df = output_df[(output_df['Del'].isnull() == True)]
-        archive_df = output_df[~(output_df['Del'].isnull() == True)]
-        col_lst = orders.columns.to_list()
-        write_df('orders_closed',archive_df[col_lst])
-        write_df('orderbook',tally_df[col_lst])
-        return render_template("close_orders.html",form=form)
+        closed, missing = close_order_numbers(form.order_no.data, current_user.username)
+        if closed:
+            flash(f"Closed order(s): {', '.join(closed)}", 'success')
+        if missing:
+            flash(f"Not in the orderbook: {', '.join(missing)}", 'error')
+        form.order_no.choices = orderbook_catalog.order_numbers()
     return render_template("close_orders.html",form=form)
 
+@app.route('/api/orders/close', methods=['POST'])
+@login_required
+@roles_required('admin', 'manager')
+def close_orders_api():
+    """Close a batch of orders: {"order_nos": [...]}"""
+    data = request.get_json(silent=True) or {}
+    order_nos = data.get('order_nos')
+    if not isinstance(order_nos, list) or not order_nos:
+        return jsonify({
+            'success': False,
+            'error': 'order_nos must be a non-empty list of order numbers'
+        }), 400
+    try:
+        closed, missing = close_order_numbers(order_nos, current_user.username)
+        return jsonify({
+            'success': bool(closed),
+            'closed': closed,
+            'not_found': missing
+        }), 200 if closed else 404
+    except Exception as e:
+        logger.error(f'Error closing orders: {str(e)}\n{traceback.format_exc()}')
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+def orderbook_duplicates_error(duplicate_combinations):
+    """Error payload listing (Order No., Design No.) combinations already in the orderbook"""
+    duplicate_msg = [f"Order No: {od[0]}, Design No: {od[1]}"
+                     for od in duplicate_combinations]
+    return {
+        'error': 'Duplicate order-design combinations found:',
+        'duplicates': duplicate_msg
+    }
+
+def process_orderbook_upload(file, filename, progress=None):
+    """Stream an orderbook sheet and append its new rows; returns (payload, status)"""
+    progress = progress or (lambda **fields: None)
+    progress(stage='reading')
+
+    # Stream the workbook and convert it in fixed-size chunks, without
+    # holding the orderbook lock: parsing a large sheet takes a while
+    parsed_version = store.version('orderbook')
+    new_records, duplicate_combinations, missing = read_orderbook_upload(
+        file, filename, store.read_shared('orderbook'),
+        progress=lambda rows_read: progress(rows_read=rows_read)
+    )
+    if missing:
+        return {'error': f'Missing required columns: {", ".join(missing)}'}, 400
+
+    if duplicate_combinations:
+        return orderbook_duplicates_error(duplicate_combinations), 400
+
+    if not new_records:
+        return {'error': 'No new records to process - all entries were duplicates'}, 400
+
+    progress(stage='merging')
+    with store.lock('orderbook'):
+        if store.version('orderbook') != parsed_version:
+            # Re-check against rows written while the sheet was being parsed
+            current = {(str(r.get('Order No.')), str(r.get('Design No.')))
+                       for r in store.read_shared('orderbook')}
+            duplicate_combinations = sorted(
+                {(str(r.get('Order No.')), str(r.get('Design No.'))) for r in new_records} & current)
+            if duplicate_combinations:
+                return orderbook_duplicates_error(duplicate_combinations), 400
+        append_json_records('orderbook', new_records)
+    progress(records_added=len(new_records))
+
+    return {
+        'success': True,
+        'message': f'Successfully processed {len(new_records)} records'
+    }, 200
+
 @app.route('/orderbook', methods=['GET', 'POST'])
 @login_required
 @roles_required('admin', 'manager')
@@ -1723,95 +1627,14 @@ def orderbook():
     """Handle orderbook operations"""
     if request.method == 'POST':
         try:
-            if 'file' not in request.files:
-                return jsonify({'error': 'No file part'}), 400
-
-            file = request.files['file']
-            if file.filename == '':
-                return jsonify({'error': 'No selected file'}), 400
-
-            if not file.filename.endswith(('.xlsx', '.xls')):
-                return jsonify({'error': 'Invalid file type. Only Excel files are allowed.'}), 400
-
-            # Read the Excel file
-            df = pd.read_excel(file)
-
-            required_columns = [
-                'Office Date', 'Office Order No', 'Date of Office',
-                'Temp. Order No.', 'Order No.', 'Combo No.', 'Design No.',
-                'Yarn Dyeing Plant', 'Yarn Dyeing Date', 'Yarn Dyeing Order No.',
-                'Quality', 'Factory Order (Meters)', 'Warping Location',
-                'Weaving Location', 'Warp Count', 'Weft Count', 'Reed',
-                'Pick', 'RS on Loom', 'Weave', 'Shafts', 'Warp Shades',
-                'Weft Shades', 'Party Name', 'Party Quantity (Meters)',
-                'Finishing Requirements', 'Selvedge', 'Delivery Date'
-            ]
-
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                return jsonify({
-                    'error': f'Missing required columns: {", ".join(missing_columns)}'
-                }), 400
-
-            # Read existing records
-            existing_records = read_json_file('orderbook')
+            file, error = get_uploaded_excel()
+            if error:
+                return error
+            if wants_background_job():
+                return submit_upload_job('orderbook', file)
 
-            # Create a set of existing order-design combinations
-            existing_combinations = {
-                (str(record.get('Order No.')), str(record.get('Design No.')))
-                for record in existing_records
-            }
-
-            # Process new records and check for duplicates
-            new_records = []
-            duplicate_combinations = set()
-
-            for _, row in df.iterrows():
-                record = {}
-                for key in required_columns:
-                    value = row.get(key)
-                    if key in ['Office Date', 'Date of Office', 'Yarn Dyeing Date', 'Delivery Date']:
-                        record[key] = format_date(value)
-                    elif pd.isna(value):
-                        record[key] = None
-                    elif isinstance(value, (int, float)):
-                        if key in ['Factory Order (Meters)', 'Party Quantity (Meters)']:
-                            record[key] = float(value)
-                        else:
-                            record[key] = value
-                    else:
-                        record[key] = str(value).strip()
-
-                # Check for duplicate order-design combination
-                order_design = (str(record.get('Order No.')), str(record.get('Design No.')))
-                if order_design in existing_combinations:
-                    duplicate_combinations.add(order_design)
-                else:
-                    record['timestamp'] = datetime.now().strftime('%d-%m-%Y %H:%M:%S')
-                    record['upload_filename'] = secure_filename(file.filename)
-                    new_records.append(record)
-                    existing_combinations.add(order_design)
-
-            if duplicate_combinations:
-                duplicate_msg = [f"Order No: {od[0]}, Design No: {od[1]}"
-                               for od in duplicate_combinations]
-                return jsonify({
-                    'error': 'Duplicate order-design combinations found:',
-                    'duplicates': duplicate_msg
-                }), 400
-
-            if new_records:
-                existing_records.extend(new_records)
-                existing_records.sort(key=lambda x: x.get('Office Date', ''), reverse=True)
-                write_json_file('orderbook', existing_records)
-                return jsonify({
-                    'success': True,
-                    'message': f'Successfully processed {len(new_records)} records'
-                })
-            else:
-                return jsonify({
-                    'error': 'No new records to process - all entries were duplicates'
-                }), 400
+            payload, status = process_orderbook_upload(file, secure_filename(file.filename))
+            return jsonify(payload), status
 
         except Exception as e:
             logger.error(f'Error processing file: {str(e)}')
@@ -1831,67 +1654,87 @@ def orderbook():
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'xlsx', 'xls'}
 
-def format_date(date_value):
-    if pd.isna(date_value):
-        return None
-    try:
-        if isinstance(date_value, str):
-            date_value = pd.to_datetime(date_value)
-        return date_value.strftime('%d-%m-%Y')
-    except:
-        return None
-
 @app.route('/orderbook/export', methods=['GET'])
+@login_required
 def export_orderbook():
     """Export orderbook data to Excel"""
+    return export_dataset_response('orderbook')
+
+@app.route('/export/<dataset>', methods=['GET'])
+@login_required
+@roles_required('admin', 'manager')
+def export_stage_data(dataset):
+    """Export any stage file to XLSX or CSV"""
+    return export_dataset_response(dataset)
+
+def export_dataset_response(dataset):
+    """Stream a dataset as XLSX (default) or CSV.
+
+    Query arguments: format=xlsx|csv, start/end=YYYY-MM-DD (inclusive) and
+    location. Records are streamed from the shared cache without building a
+    DataFrame; XLSX rows go through xlsxwriter's constant-memory mode into a
+    temporary file that is streamed back and removed.
+    """
+    spec = EXPORT_DATASETS.get(dataset)
+    if spec is None:
+        return jsonify({'error': f'Unknown dataset: {dataset}'}), 404
+
+    export_format = request.args.get('format', 'xlsx').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'Unsupported export format: {export_format}'}), 400
+
     try:
-        records = read_json_file('orderbook')
-        df = pd.DataFrame(records)
-
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            df.to_excel(writer, index=False, sheet_name='Orderbook')
-            workbook = writer.book
-            worksheet = writer.sheets['Orderbook']
-
-            header_format = workbook.add_format({
-                'bold': True,
-                'text_wrap': True,
-                'valign': 'top',
-                'bg_color': '#D3D3D3'
-            })
+        start = parse_filter_date(request.args.get('start'))
+        end = parse_filter_date(request.args.get('end'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date format. Expected format: YYYY-MM-DD'}), 400
 
-            for col_num, value in enumerate(df.columns.values):
-                worksheet.write(0, col_num, value, header_format)
+    location = request.args.get('location') or None
+    if location is not None and spec['location_field'] is None:
+        return jsonify({'error': f'{dataset} records have no location to filter on'}), 400
 
-            for i, col in enumerate(df.columns):
-                max_length = max(df[col].astype(str).apply(len).max(), len(col))
-                worksheet.set_column(i, i, min(max_length + 2, 50))
+    try:
+        # Partitioned datasets only read the months the range overlaps
+        records = store.read_range(dataset, start, end)
+        filtered = lambda: iter_export_records(records, spec, start, end, location)
+        columns, sample, count = scan_export(filtered())
+        logger.debug(f"Exporting {count} {dataset} records as {export_format}")
 
-        output.seek(0)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=f'orderbook_export_{timestamp}.xlsx'
-        )
+        headers = {'Content-Disposition': f'attachment; filename={dataset}_export_{timestamp}.{export_format}'}
+
+        if export_format == 'csv':
+            return app.response_class(iter_csv(columns, filtered()),
+                                      mimetype=EXPORT_FORMATS['csv'], headers=headers)
+
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            write_xlsx(path, spec['sheet'], columns, filtered(), column_widths(columns, sample))
+        except Exception:
+            os.remove(path)
+            raise
+        headers['Content-Length'] = str(os.path.getsize(path))
+        return app.response_class(iter_file_and_remove(path),
+                                  mimetype=EXPORT_FORMATS['xlsx'], headers=headers)
 
     except Exception as e:
-        logger.error(f'Error exporting orderbook: {str(e)}')
-        flash('Error exporting orderbook data', 'error')
-        return redirect(url_for('orderbook'))
+        logger.error(f'Error exporting {dataset}: {str(e)}\n{traceback.format_exc()}')
+        flash(f'Error exporting {spec["sheet"].lower()} data', 'error')
+        return redirect(url_for(dataset))
 
 @app.route('/orderbook/delete/<order_no>', methods=['POST'])
 def delete_order(order_no):
     """Delete an order from orderbook"""
     try:
-        records = read_json_file('orderbook')
-        original_count = len(records)
-        records = [r for r in records if r.get('Order No.') != order_no]
+        with store.lock('orderbook'):
+            records = read_json_file('orderbook')
+            original_count = len(records)
+            records = [r for r in records if r.get('Order No.') != order_no]
+            if len(records) < original_count:
+                write_json_file('orderbook', records)
 
         if len(records) < original_count:
-            write_json_file('orderbook', records)
             return jsonify({
                 'success': True,
                 'message': f'Order {order_no} deleted successfully'
@@ -1938,26 +1781,29 @@ def warping_dispatch():
             if production_details:
                 data['production_details'] = production_details
 
-            records = read_json_file('warping_dispatch')
-            existing_record_index = next((idx for idx, record in enumerate(records)
-                                       if record['beam_no'] == data['beam_no']), None)
+            with store.lock('warping_dispatch'):
+                records = read_json_file('warping_dispatch')
+                existing_record_index = next((idx for idx, record in enumerate(records)
+                                           if record['beam_no'] == data['beam_no']), None)
 
-            if existing_record_index is not None:
-                records[existing_record_index].update(data)
-                message = 'Dispatch record updated successfully'
-            else:
-                records.append(data)
-                message = 'New dispatch record added successfully'
+                if existing_record_index is not None:
+                    records[existing_record_index].update(data)
+                    message = 'Dispatch record updated successfully'
+                else:
+                    records.append(data)
+                    message = 'New dispatch record added successfully'
 
-            write_json_file('warping_dispatch', records)
+                write_json_file('warping_dispatch', records)
             return jsonify({'success': True, 'message': message})
 
         records = read_json_file('warping_dispatch')
         records.sort(key=lambda x: x.get('date', ''), reverse=True)
 
-        for record in records:
-            if 'production_details' not in record or record['production_details'] is None:
-                record['production_details'] = get_production_details(record['beam_no'])
+        # Fill in missing production details from the beam_no index in one pass
+        missing = [record for record in records if record.get('production_details') is None]
+        details = production_index.get_many(record['beam_no'] for record in missing)
+        for record in missing:
+            record['production_details'] = details[record['beam_no']]
 
         return render_template('warping_dispatch.html', form=form, records=records)
 
@@ -1979,14 +1825,6 @@ def sizing_production():
 
         if request.method == 'POST':
             if form.validate_on_submit():
-                # Double check that the beam hasn't been sized yet
-                existing_records = read_json_file('sizing_production')
-                if any(r['beam_no'] == form.beam_no.data for r in existing_records):
-                    return jsonify({
-                        'success': False,
-                        'error': f'Beam number {form.beam_no.data} has already been sized'
-                    }), 400
-
                 data = {
                     'beam_no': form.beam_no.data,
                     'status': form.status.data,
@@ -2000,9 +1838,16 @@ def sizing_production():
                     'timestamp': datetime.now().isoformat()
                 }
 
-                existing_records.append(data)
-                existing_records.sort(key=lambda x: x.get('start_datetime', ''), reverse=True)
-                write_json_file('sizing_production', existing_records)
+                with store.lock('sizing_production'):
+                    # Double check that the beam hasn't been sized yet
+                    existing_records = read_json_file('sizing_production')
+                    if any(r['beam_no'] == form.beam_no.data for r in existing_records):
+                        return jsonify({
+                            'success': False,
+                            'error': f'Beam number {form.beam_no.data} has already been sized'
+                        }), 400
+
+                    append_json_records('sizing_production', [data])
 
                 return jsonify({
                     'success': True,
@@ -2015,9 +1860,7 @@ def sizing_production():
                     'errors': form.errors
                 }), 400
 
-        records = read_json_file('sizing_production')
-        records.sort(key=lambda x: x.get('start_datetime', ''), reverse=True)
-        return render_template('sizing_production.html', form=form, records=records)
+        return render_template('sizing_production.html', form=form, grid=initial_grid('sizing_production'))
 
     except Exception as e:
         logger.error(f'Error in sizing production: {str(e)}')
@@ -2054,16 +1897,17 @@ def sizing_dispatch():
                 if sizing_details:
                     data['sizing_details'] = sizing_details
 
-                records = read_json_file('sizing_dispatch')
-                existing_record_index = next((idx for idx, record in enumerate(records)
-                                           if record['beam_no'] == data['beam_no']), None)
+                with store.lock('sizing_dispatch'):
+                    records = read_json_file('sizing_dispatch')
+                    existing_record_index = next((idx for idx, record in enumerate(records)
+                                               if record['beam_no'] == data['beam_no']), None)
 
-                if existing_record_index is not None:
-                    records[existing_record_index].update(data)
-                else:
-                    records.append(data)
+                    if existing_record_index is not None:
+                        records[existing_record_index].update(data)
+                    else:
+                        records.append(data)
 
-                write_json_file('sizing_dispatch', records)
+                    write_json_file('sizing_dispatch', records)
                 message = 'Dispatch record added successfully'
                 return jsonify({'success': True, 'message': message})
 
@@ -2086,61 +1930,11 @@ def sizing_dispatch():
 def get_available_beams_by_location(location):
     """Get list of beams available for a specific location"""
     try:
-        logger.debug(f"Starting beam search for location: {location}")
-
-        # Get all required data
-        sizing_dispatch = read_json_file('sizing_dispatch')
-        orderbook = read_json_file('orderbook')
-        beam_on_loom = read_json_file('beam_on_loom')
-        initiate_beam = read_json_file('initiate_beam')
-
-        # Log the data for debugging
-        logger.debug(f"Sizing dispatch records: {len(sizing_dispatch)}")
-        logger.debug(f"Orderbook records: {len(orderbook)}")
-        logger.debug(f"Beam on loom records: {len(beam_on_loom)}")
-        logger.debug(f"Initiate beam records: {len(initiate_beam)}")
-
-        # 1. Get all dispatched beams
-        dispatched_beams = set()
-        for record in sizing_dispatch:
-            if record.get('dispatch_status') == 'Yes':
-                dispatched_beams.add(record['beam_no'])
-        logger.debug(f"Dispatched beams: {dispatched_beams}")
-
-        # 2. Remove beams that are already on looms or initiated
-        used_beams = set()
-        for record in beam_on_loom:
-            used_beams.add(record['beam_no'])
-        for record in initiate_beam:
-            used_beams.add(record['beam_no'])
-        logger.debug(f"Used beams: {used_beams}")
-
-        # 3. Get initially available beams
-        available_beams = dispatched_beams - used_beams
-        logger.debug(f"Initially available beams: {available_beams}")
-
-        # 4. Filter beams based on weaving location
-        location_filtered_beams = set()
-        for beam in available_beams:
-            # Get the sizing details for this beam
-            sizing_record = next(
-                (record for record in sizing_dispatch if record['beam_no'] == beam),
-                None
-            )
-
-            if sizing_record:
-                # Find matching orderbook record
-                orderbook_records = [
-                    record for record in orderbook
-                    if record['Weaving Location'].strip() == location.strip()
-                ]
-
-                if orderbook_records:
-                    location_filtered_beams.add(beam)
-                    logger.debug(f"Added beam {beam} for location {location}")
-
-        logger.debug(f"Final available beams for location {location}: {location_filtered_beams}")
-        return sorted(location_filtered_beams)
+        # Dispatched from sizing, not yet initiated or on a loom, and woven
+        # at this location
+        available_beams = beam_states.available('initiate_beam', location=location)
+        logger.debug(f"Final available beams for location {location}: {available_beams}")
+        return available_beams
 
     except Exception as e:
         logger.error(f"Error in get_available_beams_by_location: {str(e)}")
@@ -2150,39 +1944,9 @@ def get_available_beams_by_location(location):
 def get_available_looms_by_location(location):
     """Get list of looms available for a specific location"""
     try:
-        # Define loom ranges for each location
-        loom_ranges = {
-            '212/1': list(range(25, 49)) + list(range(68, 113)),  # Looms 25-48 and 68-112
-            '259/1': list(range(1, 129))  # Looms 1-128
-        }
-
-        # Get all possible looms for this location
-        all_looms = loom_ranges.get(location.strip(), [])
-        logger.debug(f"All possible looms for location {location}: {all_looms}")
-
-        # Get currently used looms from beam_on_loom and initiate_beam records
-        beam_records = read_json_file('beam_on_loom')
-        initiate_records = read_json_file('initiate_beam')
-
-        used_looms = set()
-
-        # Check beam_on_loom records
-        for record in beam_records:
-            if record['status'] != 'Beam End':  # Only consider active beams
-                used_looms.add(record['loom_no'])
-
-        # Check initiate_beam records
-        for record in initiate_records:
-            if record['location'] == location:
-                used_looms.add(record['loom_no'])
-
-        logger.debug(f"Used looms: {used_looms}")
-
-        # Get available looms (all possible looms minus used looms)
-        available_looms = [loom for loom in all_looms if loom not in used_looms]
+        available_looms = loom_occupancy.free_looms(location)
         logger.debug(f"Available looms: {available_looms}")
-
-        return sorted(available_looms)
+        return available_looms
 
     except Exception as e:
         logger.error(f"Error in get_available_looms_by_location: {str(e)}")
@@ -2278,40 +2042,39 @@ def initiate_beam():
                'timestamp': datetime.now().isoformat()
            }
 
-           # Get existing records
-           initiate_records = read_json_file('initiate_beam')
-           beam_records = read_json_file('beam_on_loom')
-
-           # Validate beam not already initiated
-           if any(r['beam_no'] == initiate_data['beam_no'] for r in initiate_records):
-               return jsonify({
-                   'success': False,
-                   'error': 'Beam already initiated'
-               }), 400
-
-           # Validate loom not in use
-           if any(r['loom_no'] == initiate_data['loom_no'] and r['location'] == initiate_data['location']
-                 for r in initiate_records):
-               return jsonify({
-                   'success': False,
-                   'error': 'Loom already in use'
-               }), 400
-
-           # Add to initiate_beam records
-           initiate_records.append(initiate_data)
-           write_json_file('initiate_beam', initiate_records)
-
-           # Add initial beam on loom record
-           beam_record = {
-               'beam_no': initiate_data['beam_no'],
-               'loom_no': initiate_data['loom_no'],
-               'status': initiate_data['status'],
-               'role': 'Beam Start',
-               'name': 'System',
-               'timestamp': initiate_data['start_datetime']
-           }
-           beam_records.append(beam_record)
-           write_json_file('beam_on_loom', beam_records)
+           # Validate and save under the initiate_beam lock
+           with store.lock('initiate_beam'):
+               # Get existing records
+               initiate_records = read_json_file('initiate_beam')
+
+               # Validate beam not already initiated
+               if any(r['beam_no'] == initiate_data['beam_no'] for r in initiate_records):
+                   return jsonify({
+                       'success': False,
+                       'error': 'Beam already initiated'
+                   }), 400
+
+               # Validate loom not in use
+               if any(r['loom_no'] == initiate_data['loom_no'] and r['location'] == initiate_data['location']
+                     for r in initiate_records):
+                   return jsonify({
+                       'success': False,
+                       'error': 'Loom already in use'
+                   }), 400
+
+               # Add to initiate_beam records
+               append_json_records('initiate_beam', [initiate_data])
+
+               # Add initial beam on loom record
+               beam_record = {
+                   'beam_no': initiate_data['beam_no'],
+                   'loom_no': initiate_data['loom_no'],
+                   'status': initiate_data['status'],
+                   'role': 'Beam Start',
+                   'name': 'System',
+                   'timestamp': initiate_data['start_datetime']
+               }
+               append_json_records('beam_on_loom', [beam_record])
 
            return jsonify({
                'success': True,
@@ -2449,88 +2212,18 @@ def get_next_status(current_status):
 
 def get_available_looms_by_location_v2(location):
     """Get loom numbers based on location"""
-    loom_ranges = {
-        '212/1': list(range(25, 49)) + list(range(68, 113)),
-        '259/1': list(range(1, 129))
-    }
-    return loom_ranges.get(location.replace('%2F', '/'), [])
+    return LOOM_RANGES.get(location.replace('%2F', '/'), [])
 
 def get_available_looms_v2(location):
     """Get looms that need status updates"""
-    beam_records = read_json_file('beam_on_loom')
-    initiate_records = read_json_file('initiate_beam')
-    all_looms = get_available_looms_by_location_v2(location)
-
-    # Get looms with active beams (non-ended status)
-    already_used_looms = set()
-
-    # Track which looms have active beams (not ended)
-    for record in sorted(beam_records, key=lambda x: x.get('timestamp', ''), reverse=True):
-        loom_no = record['loom_no']
-        if loom_no not in already_used_looms:
-            if record['status'] != 'Beam End':
-                already_used_looms.add(loom_no)
-
-    # Add looms from initiate records that aren't marked as ended
-    for record in initiate_records:
-        if record['location'] == location:
-            loom_no = record['loom_no']
-            if loom_no not in already_used_looms:
-                already_used_looms.add(loom_no)
-
-    # Get all available looms for the location that aren't in use
-    available_looms = [loom for loom in all_looms if loom in already_used_looms]
-
-    return sorted(available_looms)
+    return loom_occupancy.active_looms(location)
 
 def get_beam_for_loom_v2(loom_no):
     """Get current beam number for a loom"""
     try:
-        # Convert loom_no to integer for comparison
-        loom_no = int(loom_no)
-
-        logger.debug(f"Getting beam for loom: {loom_no}")
-
-        initiate_records = read_json_file('initiate_beam')
-        beam_records = read_json_file('beam_on_loom')
-
-        logger.debug(f"Found {len(initiate_records)} initiate records")
-        logger.debug(f"Found {len(beam_records)} beam records")
-
-        # Sort and get latest initiated beam
-        sorted_initiate_records = sorted(initiate_records,
-                                      key=lambda x: x.get('timestamp', ''),
-                                      reverse=True)
-        latest_beam = None
-
-        for record in sorted_initiate_records:
-            try:
-                # Convert record's loom_no to integer for comparison
-                record_loom_no = int(record['loom_no'])
-                if record_loom_no == loom_no:
-                    latest_beam = record['beam_no']
-                    logger.debug(f"Found latest beam {latest_beam} for loom {loom_no}")
-                    break
-            except ValueError:
-                logger.error(f"Invalid loom number in record: {record}")
-                continue
-
-        if latest_beam:
-            # Check beam status
-            sorted_beam_records = sorted(beam_records,
-                                      key=lambda x: x.get('timestamp', ''),
-                                      reverse=True)
-
-            for record in sorted_beam_records:
-                if record['beam_no'] == latest_beam:
-                    if record['status'] == 'Beam End':
-                        logger.debug(f"Beam {latest_beam} has ended")
-                        return None
-                    logger.debug(f"Returning active beam {latest_beam}")
-                    return latest_beam
-
-        logger.debug(f"Returning latest beam {latest_beam}")
-        return latest_beam
+        beam_no = loom_occupancy.current_beam(int(loom_no))
+        logger.debug(f"Current beam for loom {loom_no}: {beam_no}")
+        return beam_no
 
     except Exception as e:
         logger.error(f"Error in get_beam_for_loom_v2: {str(e)}")
@@ -2538,27 +2231,7 @@ def get_beam_for_loom_v2(loom_no):
 
 def get_current_status(loom_no):
     """Get current status for a loom"""
-    beam_records = read_json_file('beam_on_loom')
-
-    # Find latest process for the loom
-    latest_record = None
-    for record in sorted(beam_records, key=lambda x: x.get('timestamp', ''), reverse=True):
-        if record['loom_no'] == loom_no:
-            latest_record = record
-            break
-
-    if latest_record:
-        if latest_record['status'] == 'Beam End':
-            return None  # Loom is available for new beam
-        return latest_record['status']
-
-    # If no beam_on_loom record, check initiate_beam
-    initiate_records = read_json_file('initiate_beam')
-    for record in sorted(initiate_records, key=lambda x: x['timestamp'], reverse=True):
-        if record['loom_no'] == loom_no:
-            return 'Beam Start'
-
-    return None
+    return loom_occupancy.current_status(loom_no)
 
 @app.route('/beam-on-loom', methods=['GET', 'POST'])
 @login_required
@@ -2593,16 +2266,6 @@ def beam_on_loom():
                         'error': 'Invalid loom number format'
                     }), 400
 
-                # Validate status transition
-                current_status = get_current_status(loom_no)
-                next_valid_status = get_next_status(current_status)
-                if data['status'] != next_valid_status:
-                    logger.error(f"Invalid status transition. Current: {current_status}, Received: {data['status']}, Expected: {next_valid_status}")
-                    return jsonify({
-                        'success': False,
-                        'error': f'Invalid status transition. Expected: {next_valid_status}'
-                    }), 400
-
                 try:
                     # Parse the datetime string in the format provided by Flatpickr
                     status_datetime = datetime.strptime(data['status_datetime'], '%Y-%m-%d %H:%M')
@@ -2632,17 +2295,34 @@ def beam_on_loom():
                     'timestamp': status_datetime.strftime('%Y-%m-%d %H:%M')
                 }
 
+                def check_transition(batch):
+                    """Validate the status transition, counting records queued ahead in the same batch"""
+                    queued = [r for r in batch if r['loom_no'] == loom_no]
+                    if queued:
+                        current_status = None if queued[-1]['status'] == 'Beam End' else queued[-1]['status']
+                    else:
+                        current_status = get_current_status(loom_no)
+                    next_valid_status = get_next_status(current_status)
+                    if data['status'] != next_valid_status:
+                        logger.error(f"Invalid status transition. Current: {current_status}, Received: {data['status']}, Expected: {next_valid_status}")
+                        return f'Invalid status transition. Expected: {next_valid_status}'
+                    return None
+
                 try:
-                    # Save the record
-                    records = read_json_file('beam_on_loom')
-                    records.append(record)
-                    write_json_file('beam_on_loom', records)
+                    # Save the record; the transition is checked when its batch
+                    # is committed, under the dataset lock
+                    write_coalescer.insert('beam_on_loom', [record], check_transition)
                     logger.info(f"Successfully added new record for beam {data['beam_no']} on loom {loom_no}")
 
                     return jsonify({
                         'success': True,
                         'message': 'Status updated successfully'
                     })
+                except InsertRejected as e:
+                    return jsonify({
+                        'success': False,
+                        'error': str(e)
+                    }), 400
                 except Exception as e:
                     logger.error(f"Error saving record: {e}")
                     return jsonify({
@@ -2677,12 +2357,8 @@ def beam_on_loom():
                 users = get_users_by_role(form.role.data)
                 form.name.choices = [('', 'Select Name')] + [(u, u) for u in users]
 
-        # Get records for display
-        records = read_json_file('beam_on_loom')
-        records.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-
-        # Render template
-        return render_template('beam_on_loom.html', form=form, records=records)
+        # Render template with the first page of records
+        return render_template('beam_on_loom.html', form=form, grid=initial_grid('beam_on_loom'))
 
     except Exception as e:
         logger.error(f'Error in beam_on_loom: {str(e)}')
@@ -2730,43 +2406,44 @@ def get_beam_info(loom_no):
             'error': str(e)
         }), 500
 
-@app.route('/api/users/<role>')
-def get_users_for_role(role):
-    """API endpoint to get users for a specific role"""
+@app.route('/api/locations/<path:location>/loom-states')
+def get_location_loom_states(location):
+    """Get beam number, current/next status and last transition for every loom at a location"""
     try:
-        logger.debug(f"Fetching users for role: {role}")
-
-        # Check if data directory exists
-        if not os.path.exists(DATA_DIR):
-            logger.error(f"Data directory not found: {DATA_DIR}")
+        location = location.replace('%2F', '/').strip()
+        if location not in LOOM_RANGES:
             return jsonify({
                 'success': False,
-                'error': 'Data directory not found'
-            }), 500
-
-        # Check if user management file exists
-        user_file = os.path.join(DATA_DIR, 'user_management.json')
-        if not os.path.exists(user_file):
-            logger.error(f"User management file not found: {user_file}")
-            return jsonify({
-                'success': False,
-                'error': 'User management file not found'
-            }), 500
-
-        # Read user data
-        with open(user_file, 'r') as f:
-            users = json.load(f)
-
-        logger.debug(f"Loaded {len(users)} users from file")
+                'error': f'Unknown location: {location}'
+            }), 404
 
-        # Filter users by role
-        matching_users = []
-        for user in users:
-            user_roles = user.get('roles', [])
-            logger.debug(f"Checking user {user.get('name')} with roles: {user_roles}")
-            if role in user_roles:
-                matching_users.append(user['name'])
+        looms = [
+            {
+                'loom_no': loom_no,
+                'beam_no': beam_no,
+                'current_status': current_status,
+                'next_status': get_next_status(current_status) if current_status else 'Beam Start',
+                'last_transition': last_transition
+            }
+            for loom_no, beam_no, current_status, last_transition in loom_occupancy.loom_states(location)
+        ]
+        return jsonify({
+            'success': True,
+            'location': location,
+            'looms': looms
+        })
+    except Exception as e:
+        logger.error(f'Error getting loom states for {location}: {str(e)}')
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
+@app.route('/api/users/<role>')
+def get_users_for_role(role):
+    """API endpoint to get users for a specific role"""
+    try:
+        matching_users = user_roles.users(role)
         logger.debug(f"Found {len(matching_users)} matching users for role {role}")
 
         return jsonify({
@@ -2813,6 +2490,17 @@ def check_users():
         })
 
 
+@app.route('/api/lock-stats')
+@login_required
+@roles_required('admin')
+def lock_stats():
+    """Dataset write-lock wait metrics of this worker process"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'locks': store.lock_stats()
+    })
+
 # =============================================================================
 # Dashboard Routes and Utilities
 # =============================================================================
@@ -2878,66 +2566,9 @@ def dashboards():
 def delayed_combos_dashboard():
     """Detailed dashboard showing delayed production combinations"""
     try:
-        # Get required data
-        orderbook = read_json_file('orderbook')
-        warping_production = read_json_file('warping_production')
-        sizing_production = read_json_file('sizing_production')
-        beam_on_loom = read_json_file('beam_on_loom')
-        grey_production = read_json_file('grey_production')
-
-        # Process production stages by combo
-        combo_stages = defaultdict(lambda: {
-            'warping': None,
-            'sizing': None,
-            'beam_on_loom': None,
-            'grey': None
-        })
-
-        # Track earliest dates for each stage
-        for record in warping_production:
-            combo = f"{record['order_no']}_{record['design_no']}"
-            date = datetime.strptime(record['timestamp'][:10], '%Y-%m-%d')
-            if not combo_stages[combo]['warping'] or date < combo_stages[combo]['warping']:
-                combo_stages[combo]['warping'] = date
-
-        for record in sizing_production:
-            # Find corresponding warping record to get order/design
-            warping_record = next((w for w in warping_production if w['beam_no'] == record['beam_no']), None)
-            if warping_record:
-                combo = f"{warping_record['order_no']}_{warping_record['design_no']}"
-                date = datetime.strptime(record['timestamp'][:10], '%Y-%m-%d')
-                if not combo_stages[combo]['sizing'] or date < combo_stages[combo]['sizing']:
-                    combo_stages[combo]['sizing'] = date
-
-        for record in beam_on_loom:
-            # Find corresponding warping record
-            warping_record = next((w for w in warping_production if w['beam_no'] == record['beam_no']), None)
-            if warping_record:
-                combo = f"{warping_record['order_no']}_{warping_record['design_no']}"
-                date = datetime.strptime(record['timestamp'][:10], '%Y-%m-%d')
-                if not combo_stages[combo]['beam_on_loom'] or date < combo_stages[combo]['beam_on_loom']:
-                    combo_stages[combo]['beam_on_loom'] = date
-
-        for record in grey_production:
-            design_no = record['design_no']
-            # Find matching orderbook record for order number
-            order_record = next((o for o in orderbook if o['Design No.'] == design_no), None)
-            if order_record:
-                combo = f"{order_record['Order No.']}_{design_no}"
-                date = datetime.strptime(record['date'], '%Y-%m-%d')
-                if not combo_stages[combo]['grey'] or date < combo_stages[combo]['grey']:
-                    combo_stages[combo]['grey'] = date
-
-        # Process orderbook and add delays
+        # Earliest date per stage for each combo comes from the combo stage index
         delayed_items = []
-        for item in orderbook:
-            if not item.get('Office Date'):
-                continue
-
-            order_date = datetime.strptime(item['Office Date'], '%Y-%m-%d')
-            combo = f"{item['Order No.']}_{item['Design No.']}"
-            stages = combo_stages[combo]
-
+        for item, order_date, stages in combo_stages.order_items():
             delay = calculate_combo_delay(order_date, stages)
             if delay >= 10:  # Only show items delayed 10 or more days
                 item_data = dict(item)
@@ -2975,10 +2606,7 @@ def status_update_dashboard():
 def get_orderbook():
     """API endpoint to get orderbook data"""
     try:
-        with open('data/orderbook.json', 'r') as f:
-            data = json.load(f)
-            logger.debug(f"Loaded orderbook data: {len(data)} records")
-            return jsonify(data)
+        return dataset_json_response('orderbook')
     except Exception as e:
         logger.error(f"Error loading orderbook: {str(e)}")
         return jsonify([])
@@ -2987,10 +2615,7 @@ def get_orderbook():
 def get_warping_production():
     """API endpoint to get warping production data"""
     try:
-        with open('data/warping_production.json', 'r') as f:
-            data = json.load(f)
-            logger.debug(f"Loaded warping data: {len(data)} records")
-            return jsonify(data)
+        return dataset_json_response('warping_production')
     except Exception as e:
         logger.error(f"Error loading warping data: {str(e)}")
         return jsonify([])
@@ -2999,10 +2624,7 @@ def get_warping_production():
 def get_beam_on_loom():
     """API endpoint to get beam on loom data"""
     try:
-        with open('data/beam_on_loom.json', 'r') as f:
-            data = json.load(f)
-            logger.debug(f"Loaded beam data: {len(data)} records")
-            return jsonify(data)
+        return dataset_json_response('beam_on_loom')
     except Exception as e:
         logger.error(f"Error loading beam data: {str(e)}")
         return jsonify([])
@@ -3011,10 +2633,7 @@ def get_beam_on_loom():
 def get_unit259_production():
     """API endpoint to get unit 259 production data"""
     try:
-        with open('data/unit259_production.json', 'r') as f:
-            data = json.load(f)
-            logger.debug(f"Loaded unit259 data: {len(data)} records")
-            return jsonify(data)
+        return dataset_json_response('unit259_production')
     except Exception as e:
         logger.error(f"Error loading unit259 data: {str(e)}")
         return jsonify([])
@@ -3023,10 +2642,7 @@ def get_unit259_production():
 def get_sizing_production():
     """API endpoint to get sizing production data"""
     try:
-        with open('data/sizing_production.json', 'r') as f:
-            data = json.load(f)
-            logger.debug(f"Loaded sizing data: {len(data)} records")
-            return jsonify(data)
+        return dataset_json_response('sizing_production')
     except Exception as e:
         logger.error(f"Error loading sizing data: {str(e)}")
         return jsonify([])
@@ -3035,10 +2651,7 @@ def get_sizing_production():
 def get_grey_production():
     """API endpoint to get grey production data"""
     try:
-        with open('data/grey_production.json', 'r') as f:
-            data = json.load(f)
-            logger.debug(f"Loaded grey production data: {len(data)} records")
-            return jsonify(data)
+        return dataset_json_response('grey_production')
     except Exception as e:
         logger.error(f"Error loading grey production data: {str(e)}")
         return jsonify([])
@@ -3049,5 +2662,9 @@ def get_grey_production():
 def grey_efficiency():
     return render_template('grey_efficiency.html')
 
-
-
+# =============================================================================
+# Background Jobs
+# =============================================================================
+# Pick up upload jobs left queued by a previous process once every route and
+# upload processor above is defined
+upload_jobs.recover()
@@ -862,6 +862,6 @@ class InitiateBeamForm(FlaskForm):
     )
     
 class close_order(FlaskForm):
-    order_no = SelectField(label = 'Order No.',
+    order_no = SelectMultipleField(label = 'Order No.',
     validators=[DataRequired()],render_kw={"class": "select2"})
     submit = SubmitField(label="Close Order")
\ No newline at end of file
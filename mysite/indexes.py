@@ -0,0 +1,834 @@
+# indexes.py
+
+from bisect import insort
+import json
+import threading
+import time
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class DerivedIndex:
+    """In-memory view derived from one or more datasets of a DataStore.
+
+    The index is built from the datasets listed in `datasets` and remembers
+    their signatures. Records appended through the store are folded in with
+    apply(); any other change (a wholesale rewrite, or a write made by
+    another worker) makes the signatures differ and the index is rebuilt on
+    its next use.
+    """
+
+    datasets = ()
+
+    def __init__(self, store):
+        self.store = store
+        self._signatures = None
+        self._lock = threading.RLock()
+        store.add_listener(self._on_write)
+
+    def build(self, data):
+        """Rebuild from scratch; data maps each dataset name to its records"""
+        raise NotImplementedError
+
+    def apply(self, name, records):
+        """Fold appended records into the index; return False to force a rebuild"""
+        return False
+
+    def ensure(self):
+        """Bring the index up to date with the store and return it"""
+        with self._lock:
+            signatures = {name: self.store.signature(name) for name in self.datasets}
+            if signatures != self._signatures:
+                self.build({name: self.store.read_shared(name) for name in self.datasets})
+                self._signatures = signatures
+            return self
+
+    def _on_write(self, name, added, old_signature, new_signature):
+        if name not in self.datasets:
+            return
+        with self._lock:
+            if self._signatures is None:
+                return
+            if (added is None or self._signatures.get(name) != old_signature
+                    or not self.apply(name, added)):
+                self._signatures = None
+                return
+            self._signatures[name] = new_signature
+
+
+# =============================================================================
+# Beam Lifecycle
+# =============================================================================
+BEAM_STAGES = [
+    'warped', 'warp-dispatched', 'sized', 'size-dispatched',
+    'initiated', 'on loom', 'QC done', 'grey produced'
+]
+
+# Pick-list queues: which beams each form offers, as (required, excluded)
+# flags of the beam's state
+BEAM_QUEUES = {
+    'warping_dispatch': ('warped', 'warp_dispatched'),
+    'sizing_production': ('warp_dispatched', 'sized'),
+    'sizing_dispatch': ('sized_ok', 'size_dispatched'),
+    'beam_on_loom': ('size_dispatched', 'loom_completed'),
+    'grey_production': ('qc_done', 'grey_produced'),
+    'initiate_beam': ('size_dispatched', 'in_use'),
+}
+
+
+class BeamStateIndex(DerivedIndex):
+    """beam_no -> pipeline stage and weaving location, plus a set per pick-list.
+
+    Each beam carries the flags the old get_available_* scans derived from
+    the stage files; every queue in BEAM_QUEUES is kept as a set so the
+    form dropdowns only cost a sort of the beams actually waiting.
+    """
+
+    datasets = (
+        'warping_production', 'warping_dispatch', 'sizing_production',
+        'sizing_dispatch', 'initiate_beam', 'beam_on_loom', 'grey_production',
+        'orderbook'
+    )
+
+    def build(self, data):
+        self.beams = {}
+        self.queues = {queue: set() for queue in BEAM_QUEUES}
+        self.combo_locations = {}
+        self.order_locations = set()
+        for record in data['orderbook']:
+            location = str(record.get('Weaving Location') or '').strip()
+            combo = (str(record.get('Order No.')), str(record.get('Design No.')))
+            self.combo_locations.setdefault(combo, location)
+            if location:
+                self.order_locations.add(location)
+        for name in self.datasets:
+            if name != 'orderbook':
+                for record in data[name]:
+                    self._add(name, record)
+
+    def apply(self, name, records):
+        if name == 'orderbook':
+            return False
+        for record in records:
+            self._add(name, record)
+        return True
+
+    def _add(self, name, record):
+        beam_no = record.get('beam_no')
+        if beam_no is None:
+            return
+        state = self.beams.get(beam_no)
+        if state is None:
+            state = self.beams[beam_no] = {'location': None}
+
+        if name == 'warping_production':
+            state['warped'] = True
+            combo = (str(record.get('order_no')), str(record.get('design_no')))
+            state['location'] = self.combo_locations.get(combo) or state['location']
+        elif name == 'warping_dispatch' and record.get('dispatch_status') == 'Yes':
+            state['warp_dispatched'] = True
+        elif name == 'sizing_production':
+            state['sized'] = True
+            if record.get('status') == 'Yes':
+                state['sized_ok'] = True
+        elif name == 'sizing_dispatch' and record.get('dispatch_status') == 'Yes':
+            state['size_dispatched'] = True
+        elif name == 'initiate_beam':
+            state['initiated'] = state['in_use'] = True
+        elif name == 'beam_on_loom':
+            state['on_loom'] = state['in_use'] = True
+            if record.get('process') == 'Beam End' and record.get('process_update') == 'End':
+                state['loom_completed'] = True
+            if record.get('process') == 'QC' and record.get('process_update') == 'End':
+                state['qc_done'] = True
+        elif name == 'grey_production':
+            state['grey_produced'] = True
+
+        for queue, (required, excluded) in BEAM_QUEUES.items():
+            if state.get(required) and not state.get(excluded):
+                self.queues[queue].add(beam_no)
+            else:
+                self.queues[queue].discard(beam_no)
+
+    def available(self, queue, location=None):
+        """Return the sorted beams waiting in a pick-list queue.
+
+        With a location, beams whose order is woven elsewhere are left out;
+        beams that cannot be traced to an order are offered wherever the
+        orderbook has orders for that location.
+        """
+        with self._lock:
+            self.ensure()
+            beams = self.queues[queue]
+            if location is not None:
+                location = location.strip()
+                known_location = location in self.order_locations
+                beams = {
+                    beam for beam in beams
+                    if self.beams[beam]['location'] == location
+                    or (not self.beams[beam]['location'] and known_location)
+                }
+            return sorted(beams)
+
+    def state(self, beam_no):
+        """Return the furthest stage and location of a beam, or None if unknown"""
+        with self._lock:
+            self.ensure()
+            state = self.beams.get(beam_no)
+            if state is None:
+                return None
+            flags = ['warped', 'warp_dispatched', 'sized', 'size_dispatched',
+                     'initiated', 'on_loom', 'qc_done', 'grey_produced']
+            stage = None
+            for flag, label in zip(flags, BEAM_STAGES):
+                if state.get(flag):
+                    stage = label
+            return {'beam_no': beam_no, 'stage': stage, 'location': state['location']}
+
+
+# =============================================================================
+# Warping Production Details
+# =============================================================================
+PRODUCTION_DETAIL_FIELDS = ['design_no', 'quantity', 'machine_no', 'warper_name', 'sections', 'breakages']
+
+
+class ProductionIndex(DerivedIndex):
+    """beam_no -> production details of the first warping record for that beam.
+
+    On the sqlite engine nothing is built: each lookup is a store.find()
+    query on the indexed beam_no column instead.
+    """
+
+    datasets = ('warping_production',)
+
+    def _find(self, beam_no):
+        records = self.store.find('warping_production', 'beam_no', beam_no)
+        return {field: records[0].get(field) for field in PRODUCTION_DETAIL_FIELDS} if records else None
+
+    def build(self, data):
+        self.details = {}
+        self.apply('warping_production', data['warping_production'])
+
+    def apply(self, name, records):
+        for record in records:
+            beam_no = record.get('beam_no')
+            if beam_no is not None and beam_no not in self.details:
+                self.details[beam_no] = {field: record.get(field) for field in PRODUCTION_DETAIL_FIELDS}
+        return True
+
+    def get(self, beam_no):
+        """Return a copy of the production details for a beam, or None"""
+        if self.store.engine == 'sqlite':
+            return self._find(beam_no)
+        with self._lock:
+            self.ensure()
+            details = self.details.get(beam_no)
+            return dict(details) if details is not None else None
+
+    def get_many(self, beam_nos):
+        """Return {beam_no: details or None} for several beams in one pass"""
+        if self.store.engine == 'sqlite':
+            return {beam_no: self._find(beam_no) for beam_no in beam_nos}
+        with self._lock:
+            self.ensure()
+            return {
+                beam_no: dict(self.details[beam_no]) if beam_no in self.details else None
+                for beam_no in beam_nos
+            }
+
+
+# =============================================================================
+# Warping Ledger
+# =============================================================================
+class WarpingLedger(DerivedIndex):
+    """Warped meters per (order_no, design_no) and the set of beam numbers used.
+
+    Validating a new warping record is then two dictionary lookups; hold
+    store.lock('warping_production') from the check through the append so
+    two submits cannot both pass against the same totals.
+    """
+
+    datasets = ('warping_production',)
+
+    def build(self, data):
+        self.warped = {}
+        self.beams = set()
+        self.apply('warping_production', data['warping_production'])
+
+    def apply(self, name, records):
+        for record in records:
+            self.beams.add(record.get('beam_no'))
+            combo = (str(record.get('order_no')), str(record.get('design_no')))
+            self.warped[combo] = self.warped.get(combo, 0) + float(record.get('quantity') or 0)
+        return True
+
+    def has_beam(self, beam_no):
+        with self._lock:
+            self.ensure()
+            return beam_no in self.beams
+
+    def warped_meters(self, order_no, design_no):
+        with self._lock:
+            self.ensure()
+            return self.warped.get((str(order_no), str(design_no)), 0)
+
+
+# =============================================================================
+# User Roles
+# =============================================================================
+# Seconds a role index trusts its data before re-checking the file for
+# writes made by another worker; writes in this process rebuild it at once
+ROLE_INDEX_RECHECK = 30
+
+
+class RoleIndex(DerivedIndex):
+    """role -> sorted user names from user_management, with (name, name) choice tuples"""
+
+    datasets = ('user_management',)
+
+    def __init__(self, store, recheck=ROLE_INDEX_RECHECK):
+        self.recheck = recheck
+        self._checked = 0
+        super().__init__(store)
+
+    def ensure(self):
+        with self._lock:
+            if self._signatures is not None and time.monotonic() - self._checked < self.recheck:
+                return self
+            super().ensure()
+            self._checked = time.monotonic()
+            return self
+
+    def build(self, data):
+        names = {}
+        for user in data['user_management']:
+            for role in user.get('roles') or []:
+                names.setdefault(role, set()).add(user['name'])
+        self.names = {role: sorted(users) for role, users in names.items()}
+        self.choices = {role: [(name, name) for name in users] for role, users in self.names.items()}
+
+    def users(self, role):
+        """Sorted names of the users holding a role"""
+        with self._lock:
+            self.ensure()
+            return list(self.names.get(role, ()))
+
+    def choice_list(self, role):
+        """(name, name) select choices for the users holding a role"""
+        with self._lock:
+            self.ensure()
+            return list(self.choices.get(role, ()))
+
+
+# =============================================================================
+# Loom Occupancy
+# =============================================================================
+LOOM_RANGES = {
+    '212/1': list(range(25, 49)) + list(range(68, 113)),  # Looms 25-48 and 68-112
+    '259/1': list(range(1, 129))  # Looms 1-128
+}
+
+
+def loom_bits(looms):
+    """Pack loom numbers into an int bitset (bit n set for loom n)"""
+    bits = 0
+    for loom in looms:
+        bits |= 1 << loom
+    return bits
+
+
+def bit_looms(bits):
+    """Unpack an int bitset into an ascending list of loom numbers"""
+    looms = []
+    while bits:
+        low = bits & -bits
+        looms.append(low.bit_length() - 1)
+        bits ^= low
+    return looms
+
+
+class LoomOccupancyIndex(DerivedIndex):
+    """Current beam, status and last transition of every loom, plus bitsets.
+
+    Built from beam_on_loom, initiate_beam and unit259_production. The
+    latest record per loom (and per beam) is tracked the way the old scans
+    picked it: the greatest timestamp wins and ties go to the earlier
+    record. The free/busy/QC-done/maintenance sets are int bitsets masked
+    with LOOM_RANGES per location.
+    """
+
+    datasets = ('beam_on_loom', 'initiate_beam', 'unit259_production')
+
+    def build(self, data):
+        self.latest = {}            # loom_no -> latest beam_on_loom record
+        self.latest_initiated = {}  # loom_no -> latest initiate_beam record
+        self.beam_latest = {}       # beam_no -> latest beam_on_loom record
+        self.located_latest = {}    # (location, loom_no) -> latest beam_on_loom record there
+        self.located_initiated = {} # (location, loom_no) -> latest initiate_beam record there
+        self.unit259_latest = {}    # loom_no -> latest unit259_production record
+        self.ever_active = 0        # looms with any status other than Beam End
+        self.initiated = {}         # location -> looms with an initiated beam
+        self.busy = 0               # looms whose latest status is not Beam End
+        self.qc_done = {}           # location -> looms whose latest status is QC End
+        self.maintenance = 0        # looms whose latest unit259 status is u/Maintenance
+        for name in self.datasets:
+            for record in data[name]:
+                self._add(name, record)
+
+    def apply(self, name, records):
+        for record in records:
+            self._add(name, record)
+        return True
+
+    @staticmethod
+    def _newer(record, current):
+        return current is None or record.get('timestamp', '') > current.get('timestamp', '')
+
+    def _add(self, name, record):
+        try:
+            loom_no = int(record.get('loom_no'))
+        except (TypeError, ValueError):
+            return
+        bit = 1 << loom_no
+
+        if name == 'beam_on_loom':
+            if record.get('status') != 'Beam End':
+                self.ever_active |= bit
+            beam_no = record.get('beam_no')
+            if self._newer(record, self.beam_latest.get(beam_no)):
+                self.beam_latest[beam_no] = record
+            key = (str(record.get('location') or '').strip(), loom_no)
+            if self._newer(record, self.located_latest.get(key)):
+                self.located_latest[key] = record
+            if not self._newer(record, self.latest.get(loom_no)):
+                return
+            previous = self.latest.get(loom_no)
+            if previous is not None and previous.get('status') == 'QC End':
+                location = previous.get('location')
+                self.qc_done[location] = self.qc_done.get(location, 0) & ~bit
+            self.latest[loom_no] = record
+            if record.get('status') == 'Beam End':
+                self.busy &= ~bit
+            else:
+                self.busy |= bit
+            if record.get('status') == 'QC End':
+                location = record.get('location')
+                self.qc_done[location] = self.qc_done.get(location, 0) | bit
+        elif name == 'initiate_beam':
+            location = record.get('location')
+            self.initiated[location] = self.initiated.get(location, 0) | bit
+            if self._newer(record, self.latest_initiated.get(loom_no)):
+                self.latest_initiated[loom_no] = record
+            key = (str(location or '').strip(), loom_no)
+            if self._newer(record, self.located_initiated.get(key)):
+                self.located_initiated[key] = record
+        elif name == 'unit259_production':
+            if not record.get('timestamp') or not self._newer(record, self.unit259_latest.get(loom_no)):
+                return
+            self.unit259_latest[loom_no] = record
+            if record.get('status') == 'u/Maintenance':
+                self.maintenance |= bit
+            else:
+                self.maintenance &= ~bit
+
+    @staticmethod
+    def location_mask(location):
+        return loom_bits(LOOM_RANGES.get(location.replace('%2F', '/').strip(), []))
+
+    def free_looms(self, location):
+        """Looms at a location never taken by an active or initiated beam"""
+        with self._lock:
+            self.ensure()
+            used = self.ever_active | self.initiated.get(location, 0)
+            return bit_looms(self.location_mask(location) & ~used)
+
+    def active_looms(self, location):
+        """Looms at a location that have had an active or initiated beam"""
+        with self._lock:
+            self.ensure()
+            used = self.ever_active | self.initiated.get(location, 0)
+            return bit_looms(self.location_mask(location) & used)
+
+    def qc_done_looms(self, location):
+        """Looms whose latest status, recorded at this location, is QC End"""
+        with self._lock:
+            self.ensure()
+            return bit_looms(self.qc_done.get(location, 0))
+
+    def maintenance_looms(self):
+        with self._lock:
+            self.ensure()
+            return bit_looms(self.maintenance)
+
+    def current_status(self, loom_no):
+        """Latest status of a loom; None when its beam has ended or it was never used"""
+        with self._lock:
+            self.ensure()
+            latest = self.latest.get(loom_no)
+            if latest is not None:
+                return None if latest.get('status') == 'Beam End' else latest.get('status')
+            if loom_no in self.latest_initiated:
+                return 'Beam Start'
+            return None
+
+    def current_beam(self, loom_no):
+        """Beam most recently initiated on a loom, unless that beam has ended"""
+        with self._lock:
+            self.ensure()
+            initiated = self.latest_initiated.get(loom_no)
+            if initiated is None:
+                return None
+            beam_no = initiated.get('beam_no')
+            latest = self.beam_latest.get(beam_no)
+            if latest is not None and latest.get('status') == 'Beam End':
+                return None
+            return beam_no
+
+    def last_transition(self, loom_no):
+        """Timestamp of the loom's latest beam_on_loom (or initiate) record"""
+        with self._lock:
+            self.ensure()
+            record = self.latest.get(loom_no) or self.latest_initiated.get(loom_no)
+            return record.get('timestamp') if record else None
+
+    def loom_states(self, location):
+        """(loom_no, current beam, current status, last transition) for every loom at a location.
+
+        Only records made at that location count, so a loom number shared
+        by two locations reports each location's own beam.
+        """
+        location = location.replace('%2F', '/').strip()
+        states = []
+        with self._lock:
+            self.ensure()
+            for loom_no in LOOM_RANGES.get(location, []):
+                latest = self.located_latest.get((location, loom_no))
+                initiated = self.located_initiated.get((location, loom_no))
+                if latest is not None:
+                    status = None if latest.get('status') == 'Beam End' else latest.get('status')
+                else:
+                    status = 'Beam Start' if initiated is not None else None
+                beam_no = initiated.get('beam_no') if initiated is not None else None
+                ended = self.beam_latest.get(beam_no)
+                if ended is not None and ended.get('status') == 'Beam End':
+                    beam_no = None
+                transition = latest or initiated
+                states.append((loom_no, beam_no, status, transition.get('timestamp') if transition else None))
+        return states
+
+
+# =============================================================================
+# Combo Stages
+# =============================================================================
+COMBO_STAGES = ['warping', 'sizing', 'beam_on_loom', 'grey']
+
+
+def parse_day(value, formats=('%Y-%m-%d',)):
+    """Parse the date part of a timestamp string; None if it does not parse"""
+    for fmt in formats:
+        try:
+            return datetime.strptime(str(value)[:10], fmt)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class ComboStageIndex(DerivedIndex):
+    """(order_no, design_no) combo -> earliest date reached in each stage.
+
+    Warping records key their beam to a combo; sizing and beam_on_loom
+    records reach their combo through that beam_no -> combo map, and grey
+    records through the first orderbook order for their design_no. Records
+    whose beam or design is not known yet are parked until it shows up.
+    """
+
+    datasets = ('orderbook', 'warping_production', 'sizing_production', 'beam_on_loom', 'grey_production')
+
+    def build(self, data):
+        self.stages = {}
+        self.beam_combo = {}
+        self.design_order = {}
+        self.pending_beams = {}
+        self.orders = []
+        for item in data['orderbook']:
+            self.design_order.setdefault(item.get('Design No.'), item.get('Order No.'))
+            if not item.get('Office Date'):
+                continue
+            order_date = parse_day(item['Office Date'], ('%Y-%m-%d', '%d-%m-%Y'))
+            if order_date is None:
+                continue
+            self.orders.append((item, order_date, f"{item['Order No.']}_{item['Design No.']}"))
+        for name in self.datasets[1:]:
+            self.apply(name, data[name])
+
+    def apply(self, name, records):
+        if name == 'orderbook':
+            return False
+        for record in records:
+            if name == 'warping_production':
+                beam_no = record.get('beam_no')
+                combo = f"{record.get('order_no')}_{record.get('design_no')}"
+                self._reach(combo, 'warping', parse_day(record.get('timestamp')))
+                if beam_no not in self.beam_combo:
+                    self.beam_combo[beam_no] = combo
+                    for stage, day in self.pending_beams.pop(beam_no, []):
+                        self._reach(combo, stage, day)
+            elif name in ('sizing_production', 'beam_on_loom'):
+                stage = 'sizing' if name == 'sizing_production' else 'beam_on_loom'
+                day = parse_day(record.get('timestamp'))
+                combo = self.beam_combo.get(record.get('beam_no'))
+                if combo is None:
+                    self.pending_beams.setdefault(record.get('beam_no'), []).append((stage, day))
+                else:
+                    self._reach(combo, stage, day)
+            elif name == 'grey_production':
+                design_no = record.get('design_no')
+                if design_no in self.design_order:
+                    combo = f"{self.design_order[design_no]}_{design_no}"
+                    self._reach(combo, 'grey', parse_day(record.get('date')))
+        return True
+
+    def _reach(self, combo, stage, day):
+        if day is None:
+            return
+        stages = self.stages.get(combo)
+        if stages is None:
+            stages = self.stages[combo] = dict.fromkeys(COMBO_STAGES)
+        if stages[stage] is None or day < stages[stage]:
+            stages[stage] = day
+
+    def combo_stages(self, combo):
+        with self._lock:
+            self.ensure()
+            return dict(self.stages.get(combo) or dict.fromkeys(COMBO_STAGES))
+
+    def order_items(self):
+        """Return (orderbook item, order date, stages) for every dated order line"""
+        with self._lock:
+            self.ensure()
+            return [
+                (item, order_date, dict(self.stages.get(combo) or dict.fromkeys(COMBO_STAGES)))
+                for item, order_date, combo in self.orders
+            ]
+
+
+# =============================================================================
+# Record Grids
+# =============================================================================
+def grid_sort_key(value):
+    """Sort key ordering numbers (or numeric text) numerically, then text, then blanks"""
+    if value is None or value == '':
+        return (2, 0.0, '')
+    if isinstance(value, (int, float)):
+        return (0, float(value), '') if value == value else (2, 0.0, '')
+    text = str(value)
+    try:
+        number = float(text)
+        if number == number:
+            return (0, number, '')
+    except ValueError:
+        pass
+    return (1, 0.0, text.lower())
+
+
+class RecordGridIndex(DerivedIndex):
+    """Sorted views of one dataset for a server-side DataTables grid.
+
+    `columns` lists the record field behind each grid column (None for
+    computed or action columns, which cannot be sorted or searched). A
+    sorted list of record positions is built the first time an ordering is
+    requested and kept up to date by insertion as records are appended, so
+    a page is a slice of that list; only a search has to scan, and it does
+    so over the prebuilt lowercase search text of each record.
+    """
+
+    def __init__(self, store, dataset, columns):
+        self.datasets = (dataset,)
+        self.columns = columns
+        self.fields = [field for field in columns if field is not None]
+        super().__init__(store)
+
+    def build(self, data):
+        self.records = list(data[self.datasets[0]])
+        self.text = [self._search_text(record) for record in self.records]
+        self.orders = {}
+
+    def apply(self, name, records):
+        for record in records:
+            position = len(self.records)
+            self.records.append(record)
+            self.text.append(self._search_text(record))
+            for fields, order in self.orders.items():
+                insort(order, position, key=lambda p, fields=fields: self._key(fields, p))
+        return True
+
+    def _search_text(self, record):
+        return ' '.join(str(record.get(field, '') or '') for field in self.fields).lower()
+
+    def _key(self, fields, position):
+        record = self.records[position]
+        return tuple(grid_sort_key(record.get(field)) for field in fields)
+
+    def _ordering(self, fields):
+        order = self.orders.get(fields)
+        if order is None:
+            order = self.orders[fields] = sorted(range(len(self.records)), key=lambda p: self._key(fields, p))
+        return order
+
+    def _sorted(self, order_by):
+        """(positions, descending) for order_by, a list of (column index, descending).
+
+        Orderings in one direction share the cached ascending list and are
+        walked backwards when descending; mixed directions are sorted on demand.
+        """
+        keys = [(self.columns[column], descending) for column, descending in order_by
+                if 0 <= column < len(self.columns) and self.columns[column] is not None]
+        if not keys:
+            return list(range(len(self.records))), False
+
+        if len({descending for _, descending in keys}) == 1:
+            return self._ordering(tuple(field for field, _ in keys)), keys[0][1]
+
+        # Mixed directions: stable sorts from the last key to the first
+        order = list(range(len(self.records)))
+        for field, descending in reversed(keys):
+            order.sort(key=lambda p: grid_sort_key(self.records[p].get(field)), reverse=descending)
+        return order, False
+
+    def page(self, order_by, search='', start=0, length=10):
+        """Return (records_total, records_filtered, records) for one grid page"""
+        with self._lock:
+            self.ensure()
+            total = len(self.records)
+            if length is None or length < 0:
+                length = total
+            order, descending = self._sorted(order_by)
+            words = search.lower().split()
+
+            if not words:
+                if descending:
+                    end = total - start
+                    positions = order[max(end - length, 0):max(end, 0)][::-1]
+                else:
+                    positions = order[start:start + length]
+                return total, total, [self.records[p] for p in positions]
+
+            ordered = reversed(order) if descending else order
+            matches = [p for p in ordered if all(word in self.text[p] for word in words)]
+            return total, len(matches), [self.records[p] for p in matches[start:start + length]]
+
+
+# =============================================================================
+# Orderbook Catalog
+# =============================================================================
+def factory_meters(record):
+    return float(record.get('Factory Order (Meters)') or 0)
+
+
+class OrderbookCatalog(DerivedIndex):
+    """Orderbook rows indexed by Order No., (Order No., Design No.) and
+    (Design No., Weaving Location), with factory meters summed per combo.
+
+    Uploads append and are folded in per order; closing or deleting orders
+    rewrites the orderbook and rebuilds the catalog. The warping form's
+    design_by_order mapping is kept per order and serialized once per change.
+    """
+
+    datasets = ('orderbook',)
+
+    def build(self, data):
+        self.by_order = {}
+        self.by_combo = {}
+        self.combo_meters = {}
+        self.by_design_location = {}
+        self.design_by_order = {}
+        self._design_by_order_json = None
+        self.apply('orderbook', data['orderbook'])
+
+    def apply(self, name, records):
+        changed = set()
+        for record in records:
+            order_no = str(record.get('Order No.', ''))
+            design_no = str(record.get('Design No.', ''))
+            combo = (order_no, design_no)
+            self.by_order.setdefault(order_no, []).append(record)
+            self.by_combo.setdefault(combo, []).append(record)
+            self.combo_meters[combo] = self.combo_meters.get(combo, 0) + factory_meters(record)
+            place = (design_no.strip(), str(record.get('Weaving Location', '')).strip())
+            self.by_design_location.setdefault(place, record)
+            changed.add(order_no)
+        for order_no in changed:
+            if order_no:
+                self.design_by_order[order_no] = self._designs_entry(order_no)
+        if changed:
+            self._design_by_order_json = None
+        return True
+
+    def _designs_entry(self, order_no):
+        """design_by_order[order_no]: "<design> (Total: <m>m)" -> design info"""
+        designs = {}
+        for record in self.by_order[order_no]:
+            design_no = str(record.get('Design No.', ''))
+            designs.setdefault(design_no, []).append({
+                'quantity': factory_meters(record),
+                'order_details': record
+            })
+        entry = {}
+        for design_no, orders in designs.items():
+            total = self.combo_meters[(order_no, design_no)]
+            entry[f"{design_no} (Total: {total}m)"] = {
+                'design_no': design_no,
+                'quantity': total,
+                'individual_orders': orders
+            }
+        return entry
+
+    def order_numbers(self):
+        with self._lock:
+            self.ensure()
+            return sorted(self.design_by_order)
+
+    def design_choices(self, order_no):
+        """(design_no, label) pairs of an order, sorted by label; None for an unknown order"""
+        with self._lock:
+            self.ensure()
+            entry = self.design_by_order.get(order_no)
+            if entry is None:
+                return None
+            return [(info['design_no'], label) for label, info in sorted(entry.items())]
+
+    def designs(self, order_no):
+        """Sorted distinct non-empty Design No. values of an order"""
+        with self._lock:
+            self.ensure()
+            return sorted({
+                str(record.get('Design No.')) for record in self.by_order.get(str(order_no), [])
+                if record.get('Design No.')
+            })
+
+    def design_numbers(self):
+        """Sorted distinct non-empty Design No. values across the orderbook"""
+        with self._lock:
+            self.ensure()
+            return sorted({design_no.strip() for _, design_no in self.by_combo if design_no.strip()})
+
+    def factory_meters(self, order_no, design_no):
+        """Total Factory Order (Meters) of an (Order No., Design No.) combo"""
+        with self._lock:
+            self.ensure()
+            return self.combo_meters.get((str(order_no), str(design_no)), 0)
+
+    def design_at_location(self, design_no, location):
+        """First orderbook row of a design woven at a location, or None"""
+        with self._lock:
+            self.ensure()
+            return self.by_design_location.get((str(design_no).strip(), str(location).strip()))
+
+    def design_by_order_json(self):
+        with self._lock:
+            self.ensure()
+            if self._design_by_order_json is None:
+                self._design_by_order_json = json.dumps(self.design_by_order)
+            return self._design_by_order_json
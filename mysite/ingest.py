@@ -0,0 +1,244 @@
+# ingest.py
+
+from datetime import datetime
+from itertools import islice
+import logging
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+logger = logging.getLogger(__name__)
+
+GREY_REQUIRED_COLUMNS = [
+    'Date', 'Piece No.', 'Loom No.', 'Design No.',
+    'Grey Production (Meters)', 'Grey Production (Weight)', 'Remarks'
+]
+
+ORDERBOOK_REQUIRED_COLUMNS = [
+    'Office Date', 'Office Order No', 'Date of Office',
+    'Temp. Order No.', 'Order No.', 'Combo No.', 'Design No.',
+    'Yarn Dyeing Plant', 'Yarn Dyeing Date', 'Yarn Dyeing Order No.',
+    'Quality', 'Factory Order (Meters)', 'Warping Location',
+    'Weaving Location', 'Warp Count', 'Weft Count', 'Reed',
+    'Pick', 'RS on Loom', 'Weave', 'Shafts', 'Warp Shades',
+    'Weft Shades', 'Party Name', 'Party Quantity (Meters)',
+    'Finishing Requirements', 'Selvedge', 'Delivery Date'
+]
+ORDERBOOK_DATE_COLUMNS = ['Office Date', 'Date of Office', 'Yarn Dyeing Date', 'Delivery Date']
+ORDERBOOK_METER_COLUMNS = ['Factory Order (Meters)', 'Party Quantity (Meters)']
+
+# Rows converted per batch when streaming a sheet
+CHUNK_SIZE = 1000
+
+
+def format_date(date_value):
+    if pd.isna(date_value):
+        return None
+    try:
+        if isinstance(date_value, str):
+            date_value = pd.to_datetime(date_value)
+        return date_value.strftime('%d-%m-%Y')
+    except:
+        return None
+
+
+def missing_columns(columns, required_columns):
+    """Return the required columns that are absent from an uploaded sheet"""
+    return [col for col in required_columns if col not in columns]
+
+
+def _text(col):
+    """str() of every cell, stripped, like the per-row str(value).strip()"""
+    return col.map(str).astype(object).str.strip()
+
+
+def _to_datetimes(col):
+    """Parse a column to datetimes, with NaT where a value does not parse"""
+    if pd.api.types.is_datetime64_any_dtype(col):
+        return col
+    return pd.to_datetime(col.map(lambda v: pd.to_datetime(v, errors='coerce')), errors='coerce')
+
+
+def _positive_numbers(col):
+    """Mask of cells holding an int/float greater than zero"""
+    if pd.api.types.is_numeric_dtype(col):
+        return col.notna() & (col > 0)
+    is_number = col.map(lambda v: isinstance(v, (int, float)) and not pd.isna(v))
+    return is_number & (pd.to_numeric(col.where(is_number), errors='coerce') > 0)
+
+
+def validate_grey_upload(df, existing_records):
+    """Validate a grey production/dispatch sheet against the existing records.
+
+    Returns (new_records, error_messages). Each invalid row gets the message
+    for the first check it fails, and rows that pass every check but repeat
+    a piece number (already stored, or earlier in the sheet) are reported in
+    one "Duplicate piece numbers" line.
+    """
+    existing_pieces = {str(record.get('piece_no')).strip().upper() for record in existing_records}
+    rows = pd.Series(df.index + 2, index=df.index)
+    piece = _text(df['Piece No.']).str.upper()
+
+    piece_missing = df['Piece No.'].isna()
+    date_missing = df['Date'].isna()
+    dates = _to_datetimes(df['Date'])
+    date_invalid = dates.isna()
+    date_future = dates > pd.Timestamp.now()
+    loom_text = _text(df['Loom No.'])
+    loom_invalid = df['Loom No.'].isna() | ~loom_text.str.isdigit()
+    meters_invalid = ~_positive_numbers(df['Grey Production (Meters)'])
+    weight_invalid = ~_positive_numbers(df['Grey Production (Weight)'])
+
+    # First failing check per row, in the order the checks are applied
+    checks = [
+        (piece_missing, "Row {row}: Piece number cannot be empty"),
+        (date_missing, "Row {row}: Date is required for piece number {piece}"),
+        (date_invalid, "Row {row}: Invalid date format for piece number {piece}"),
+        (date_future, "Row {row}: Date cannot be in the future for piece number {piece}"),
+        (loom_invalid, "Row {row}: Invalid loom number for piece number {piece}"),
+        (meters_invalid, "Row {row}: Invalid production meters for piece number {piece}"),
+        (weight_invalid, "Row {row}: Invalid production weight for piece number {piece}"),
+    ]
+    failed = np.select([mask.to_numpy(dtype=bool) for mask, _ in checks],
+                       list(range(len(checks))), default=-1)
+    failed = pd.Series(failed, index=df.index)
+
+    error_messages = [
+        checks[check][1].format(row=row, piece=p)
+        for check, row, p in zip(failed[failed >= 0], rows[failed >= 0], piece[failed >= 0])
+    ]
+
+    valid = failed < 0
+    duplicate_existing = valid & piece.isin(existing_pieces)
+    candidates = valid & ~duplicate_existing
+    duplicate_new = candidates & piece.where(candidates).duplicated()
+    duplicates = duplicate_existing | duplicate_new
+    duplicate_pieces = piece[duplicates].tolist()
+    if duplicate_pieces:
+        error_messages.append(f"Duplicate piece numbers found: {', '.join(duplicate_pieces)}")
+
+    accepted = df[candidates & ~duplicate_new]
+    timestamp = datetime.now().isoformat()
+    remarks = accepted['Remarks']
+    new_records = [
+        {
+            'date': date_str,
+            'piece_no': piece_no,
+            'loom_no': loom_no,
+            'design_no': design_no,
+            'production_meters': meters,
+            'production_weight': weight,
+            'remarks': remark,
+            'timestamp': timestamp
+        }
+        for date_str, piece_no, loom_no, design_no, meters, weight, remark in zip(
+            dates[accepted.index].dt.strftime('%Y-%m-%d').tolist(),
+            piece[accepted.index].tolist(),
+            loom_text[accepted.index].astype(int).tolist(),
+            _text(accepted['Design No.']).tolist(),
+            pd.to_numeric(accepted['Grey Production (Meters)']).astype(float).tolist(),
+            pd.to_numeric(accepted['Grey Production (Weight)']).astype(float).tolist(),
+            remarks.map(str).astype(object).where(remarks.notna(), '').tolist()
+        )
+    ]
+    return new_records, error_messages
+
+
+def iter_sheet_chunks(file, filename, chunk_size=CHUNK_SIZE):
+    """Yield the header row, then lists of up to chunk_size data rows (tuples).
+
+    .xlsx workbooks are read with openpyxl in read-only mode, which walks
+    the sheet XML row by row instead of loading the whole workbook. Legacy
+    .xls files cannot be streamed and go through pandas.read_excel.
+    Fully blank rows are skipped.
+    """
+    if not filename.lower().endswith('.xlsx'):
+        df = pd.read_excel(file)
+        yield list(df.columns)
+        yield from _chunks(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None), chunk_size)
+        return
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        # The first sheet, as pandas.read_excel reads it; workbook.active is
+        # whichever tab happened to be selected when the file was saved
+        sheet = workbook.worksheets[0]
+        # Some writers store a wrong dimension record, which would cut rows short
+        sheet.reset_dimensions()
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        yield [str(col) if col is not None else f'Unnamed: {i}' for i, col in enumerate(header)]
+        yield from _chunks(rows, chunk_size)
+    finally:
+        workbook.close()
+
+
+def _chunks(rows, chunk_size):
+    rows = (row for row in rows if any(value is not None for value in row))
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def convert_orderbook_row(values):
+    """Convert one orderbook row ({column: cell}) to a record"""
+    record = {}
+    for key in ORDERBOOK_REQUIRED_COLUMNS:
+        value = values.get(key)
+        if key in ORDERBOOK_DATE_COLUMNS:
+            record[key] = format_date(value)
+        elif value is None or pd.isna(value):
+            record[key] = None
+        elif isinstance(value, (int, float)):
+            if key in ORDERBOOK_METER_COLUMNS:
+                record[key] = float(value)
+            else:
+                record[key] = value
+        else:
+            record[key] = str(value).strip()
+    return record
+
+
+def read_orderbook_upload(file, filename, existing_records, chunk_size=CHUNK_SIZE, progress=None):
+    """Stream an orderbook sheet and return (new_records, duplicates, missing_columns).
+
+    Rows are converted chunk by chunk and their (Order No., Design No.)
+    combination is checked against a key set built from existing_records
+    and the rows accepted so far, so memory is bounded by the accepted
+    records rather than the workbook. progress(rows_read) is called after
+    each chunk when given.
+    """
+    chunks = iter_sheet_chunks(file, filename, chunk_size)
+    header = next(chunks)
+    missing = missing_columns(header, ORDERBOOK_REQUIRED_COLUMNS)
+    if missing:
+        chunks.close()
+        return [], [], missing
+
+    positions = {col: header.index(col) for col in ORDERBOOK_REQUIRED_COLUMNS}
+    existing_combinations = {
+        (str(record.get('Order No.')), str(record.get('Design No.')))
+        for record in existing_records
+    }
+    new_records = []
+    duplicate_combinations = set()
+    rows_read = 0
+    for chunk in chunks:
+        for row in chunk:
+            values = {col: row[i] if i < len(row) else None for col, i in positions.items()}
+            record = convert_orderbook_row(values)
+            order_design = (str(record.get('Order No.')), str(record.get('Design No.')))
+            if order_design in existing_combinations:
+                duplicate_combinations.add(order_design)
+            else:
+                record['timestamp'] = datetime.now().strftime('%d-%m-%Y %H:%M:%S')
+                record['upload_filename'] = filename
+                new_records.append(record)
+                existing_combinations.add(order_design)
+        rows_read += len(chunk)
+        if progress is not None:
+            progress(rows_read)
+    return new_records, sorted(duplicate_combinations), []
@@ -0,0 +1,198 @@
+# jobs.py
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import logging
+import os
+import tempfile
+import threading
+import traceback
+import uuid
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class JobQueue:
+    """Background upload jobs run on a thread pool and persisted under data/jobs/.
+
+    Every job is one JSON file (<id>.json) next to the uploaded file it works
+    on (<id>.upload.<ext>, keeping the extension the readers dispatch on), so its status survives restarts and is visible to every
+    worker process. A handler registered for the job kind is called as
+    handler(upload_path, filename, progress) and returns (payload, status)
+    exactly like the synchronous upload routes; progress(**fields) merges
+    counters such as rows_read into the job record while it runs.
+    """
+
+    def __init__(self, jobs_dir, max_workers=2):
+        self.jobs_dir = jobs_dir
+        self.handlers = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upload-job')
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def _path(self, job_id, suffix='json'):
+        return os.path.join(self.jobs_dir, f'{job_id}.{suffix}')
+
+    def get(self, job_id):
+        """Return the stored job record, or None for an unknown id"""
+        if not job_id or os.path.basename(job_id) != job_id:
+            return None
+        try:
+            with open(self._path(job_id), 'r') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save(self, job):
+        """Replace the job file atomically; other workers poll it through /api/jobs/<id>"""
+        job['updated_at'] = datetime.now().isoformat()
+        fd, tmp_path = tempfile.mkstemp(dir=self.jobs_dir, prefix=f'.{job["id"]}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(job, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._path(job['id']))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _update(self, job_id, **fields):
+        """Merge fields into a stored job; None when its file is gone or unreadable"""
+        with self._lock:
+            job = self.get(job_id)
+            if job is None:
+                logger.warning(f'Job {job_id} has no readable record, dropping update {sorted(fields)}')
+                return None
+            job.update(fields)
+            self._save(job)
+            return job
+
+    def submit(self, kind, file, filename, user=None):
+        """Store the uploaded file, queue a job for it and return the job record"""
+        if kind not in self.handlers:
+            raise ValueError(f'No handler registered for job kind {kind}')
+        job_id = uuid.uuid4().hex
+        upload_suffix = 'upload' + os.path.splitext(filename)[1].lower()
+        file.save(self._path(job_id, upload_suffix))
+        now = datetime.now().isoformat()
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'status': JOB_QUEUED,
+            'filename': filename,
+            'upload_suffix': upload_suffix,
+            'user': user,
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'stage': None,
+            'rows_read': 0,
+            'records_added': 0,
+            'message': None,
+            'errors': [],
+            'result': None,
+            'result_status': None,
+        }
+        with self._lock:
+            self._save(job)
+        self._executor.submit(self._run, job_id)
+        logger.info(f'Queued {kind} job {job_id} for {filename}')
+        return job
+
+    def _claim(self, job_id):
+        """Atomically claim a job for this process so it only runs once"""
+        try:
+            fd = os.open(self._path(job_id, 'claim'), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+
+    def _claim_alive(self, job_id):
+        try:
+            with open(self._path(job_id, 'claim'), 'r') as f:
+                os.kill(int(f.read()), 0)
+            return True
+        except (FileNotFoundError, ValueError, ProcessLookupError):
+            return False
+        except PermissionError:
+            return True
+
+    def _run(self, job_id):
+        if not self._claim(job_id):
+            return
+        job = self._update(job_id, status=JOB_RUNNING, started_at=datetime.now().isoformat())
+        if job is None:
+            # The job record was deleted or pruned before it could start
+            for name in os.listdir(self.jobs_dir):
+                if name.startswith(f'{job_id}.upload') or name == f'{job_id}.claim':
+                    os.remove(os.path.join(self.jobs_dir, name))
+            return
+        handler = self.handlers[job['kind']]
+        upload_path = self._path(job_id, job['upload_suffix'])
+        try:
+            payload, status = handler(upload_path, job['filename'],
+                                      lambda **fields: self._update(job_id, **fields))
+            errors = payload.get('details') or payload.get('duplicates') or []
+            self._update(
+                job_id,
+                status=JOB_DONE if status < 400 else JOB_FAILED,
+                stage=None,
+                message=payload.get('message') or payload.get('error'),
+                errors=errors,
+                result=payload,
+                result_status=status,
+                finished_at=datetime.now().isoformat()
+            )
+        except Exception as e:
+            logger.error(f'Error in {job["kind"]} job {job_id}: {str(e)}\n{traceback.format_exc()}')
+            self._update(
+                job_id,
+                status=JOB_FAILED,
+                message=f'Error processing file: {str(e)}',
+                result={'error': f'Error processing file: {str(e)}'},
+                result_status=500,
+                finished_at=datetime.now().isoformat()
+            )
+        finally:
+            for path in (upload_path, self._path(job_id, 'claim')):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def recover(self):
+        """Requeue jobs left queued by a previous process and fail interrupted ones.
+
+        A job whose claiming process is gone may already have merged its
+        records, so it is not retried; re-uploading reports the duplicates.
+        Jobs claimed by a live worker process are left alone.
+        """
+        for name in sorted(os.listdir(self.jobs_dir)):
+            if not name.endswith('.json'):
+                continue
+            job = self.get(name[:-len('.json')])
+            if job is None:
+                continue
+            if job['status'] == JOB_QUEUED and job['kind'] in self.handlers \
+                    and os.path.exists(self._path(job['id'], job['upload_suffix'])) \
+                    and not os.path.exists(self._path(job['id'], 'claim')):
+                self._executor.submit(self._run, job['id'])
+            elif job['status'] in (JOB_QUEUED, JOB_RUNNING) and not self._claim_alive(job['id']):
+                message = 'Job was interrupted by a server restart, please upload the file again'
+                self._update(job['id'], status=JOB_FAILED, message=message,
+                             result={'error': message}, result_status=500,
+                             finished_at=datetime.now().isoformat())
+                for suffix in (job['upload_suffix'], 'claim'):
+                    if os.path.exists(self._path(job['id'], suffix)):
+                        os.remove(self._path(job['id'], suffix))
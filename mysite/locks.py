@@ -0,0 +1,89 @@
+# locks.py
+
+from contextlib import contextmanager
+import fcntl
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Waits longer than this (seconds) are logged as lock contention
+LOCK_WAIT_WARNING = 1.0
+
+
+class DatasetLocks:
+    """Per-dataset exclusive locks shared by threads and worker processes.
+
+    Each dataset has a lock file <lock_dir>/<name>.lock that writers flock
+    for the whole read-modify-write, after taking a per-process RLock so
+    threads queue in memory rather than on the file. The lock is reentrant
+    within a thread: only the outermost holder takes the file lock, since a
+    second flock on a new descriptor would wait on the first.
+
+    Time spent waiting for each outermost acquisition is recorded per
+    dataset and reported by stats().
+    """
+
+    def __init__(self, lock_dir):
+        self.lock_dir = lock_dir
+        self._locks = {}
+        self._guard = threading.Lock()
+        self._held = threading.local()  # name -> lock depth in this thread
+        self._stats = {}  # name -> {'acquired', 'contended', 'wait_total', 'wait_max'}
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.lock_dir, f'{name}.lock')
+
+    @contextmanager
+    def lock(self, name):
+        held = self._held.__dict__
+        if held.get(name):
+            held[name] += 1
+            try:
+                yield
+            finally:
+                held[name] -= 1
+            return
+
+        with self._guard:
+            thread_lock = self._locks.setdefault(name, threading.RLock())
+        started = time.monotonic()
+        with thread_lock:
+            with open(self.path(name), 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                self._record_wait(name, time.monotonic() - started)
+                held[name] = 1
+                try:
+                    yield
+                finally:
+                    held[name] = 0
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _record_wait(self, name, waited):
+        with self._guard:
+            stats = self._stats.setdefault(
+                name, {'acquired': 0, 'contended': 0, 'wait_total': 0.0, 'wait_max': 0.0})
+            stats['acquired'] += 1
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+            if waited >= 0.001:
+                stats['contended'] += 1
+        if waited >= LOCK_WAIT_WARNING:
+            logger.warning(f"Waited {waited:.2f}s for the {name} write lock")
+
+    def stats(self):
+        """Lock wait metrics of this process: {name: {acquired, contended, wait_total_ms, wait_avg_ms, wait_max_ms}}"""
+        with self._guard:
+            return {
+                name: {
+                    'acquired': stats['acquired'],
+                    'contended': stats['contended'],
+                    'wait_total_ms': round(stats['wait_total'] * 1000, 3),
+                    'wait_avg_ms': round(stats['wait_total'] * 1000 / stats['acquired'], 3),
+                    'wait_max_ms': round(stats['wait_max'] * 1000, 3),
+                }
+                for name, stats in sorted(self._stats.items())
+            }
@@ -0,0 +1,74 @@
+# serialization.py
+
+from datetime import date, datetime
+from decimal import Decimal
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # Flask < 2.2 has no pluggable JSON provider
+    DefaultJSONProvider = None
+
+HAVE_ORJSON = orjson is not None
+
+if HAVE_ORJSON:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def _default(obj):
+    """Values neither encoder handles natively: dates (stdlib only), numpy scalars, Decimals"""
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if hasattr(obj, 'item') and callable(obj.item):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(obj, pretty=False, sort_keys=False):
+    """Serialize to a JSON string: compact by default, indented when pretty.
+
+    Uses orjson when it is installed (dates and datetimes become ISO 8601
+    strings natively) and the standard library otherwise.
+    """
+    if HAVE_ORJSON:
+        options = _OPTIONS
+        if pretty:
+            options |= orjson.OPT_INDENT_2
+        if sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=options).decode()
+    if pretty:
+        return json.dumps(obj, default=_default, sort_keys=sort_keys, indent=4)
+    return json.dumps(obj, default=_default, sort_keys=sort_keys, separators=(',', ':'))
+
+
+def loads(data):
+    """Parse JSON from a str or bytes"""
+    if HAVE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def load(f):
+    """Parse JSON from an open file"""
+    return loads(f.read())
+
+
+if DefaultJSONProvider is not None:
+    class FastJSONProvider(DefaultJSONProvider):
+        """Flask JSON provider that serializes jsonify() responses through dumps()"""
+
+        def dumps(self, obj, **kwargs):
+            return dumps(obj, pretty='indent' in kwargs, sort_keys=kwargs.get('sort_keys', self.sort_keys))
+
+        def loads(self, s, **kwargs):
+            return loads(s)
+else:
+    FastJSONProvider = None
@@ -0,0 +1,74 @@
+# test_changes.py
+
+import importlib
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'mysite'))
+
+from changes import ChangeLog
+
+
+@pytest.fixture
+def change_log(tmp_path):
+    return ChangeLog(str(tmp_path / 'changes'))
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    """The app running against a copy of the data directory"""
+    work = tmp_path_factory.mktemp('app')
+    shutil.copytree(os.path.join(ROOT, 'data'), work / 'data')
+    cwd = os.getcwd()
+    os.chdir(work)
+    try:
+        flask_app = importlib.import_module('flask_app')
+    finally:
+        os.chdir(cwd)
+    flask_app.app.config['TESTING'] = True
+    return flask_app.app
+
+
+@pytest.fixture
+def client(app):
+    """Test client logged in as the admin user"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = '1'
+        session['_fresh'] = True
+    return client
+
+
+def test_since_on_empty_log(change_log):
+    assert change_log.since('orderbook', 0) == []
+    assert change_log.since('orderbook', -3) is None
+    assert change_log.since('orderbook', 5) is None
+
+
+def test_since_rejects_negative_cursor(change_log):
+    change_log.record_append('orderbook', None, [{'Order No.': 'O1'}], None, lambda: [])
+    assert change_log.since('orderbook', -1) is None
+    assert [entry['seq'] for entry in change_log.since('orderbook', 0)] == [1]
+    assert change_log.since('orderbook', 1) == []
+
+
+@pytest.mark.parametrize('query', ['since=-3', 'since=-1&limit=10', 'since=0&limit=0', 'limit=-5'])
+def test_get_changes_rejects_bad_cursor_or_limit(client, query):
+    response = client.get(f'/api/changes/orders_closed?{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_get_changes_from_zero_cursor(client):
+    response = client.get('/api/changes/orders_closed?since=0')
+    assert response.status_code == 200
+    assert response.get_json()['reset'] is False
+
+
+def test_get_changes_requires_login(app):
+    response = app.test_client().get('/api/changes/orderbook?since=0')
+    assert response.status_code in (302, 401)